@@ -0,0 +1,39 @@
+import os
+
+import httpx
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+router = APIRouter()
+
+KNOWLEDGE_SERVICE_URL = os.getenv("KNOWLEDGE_SERVICE_URL", "http://knowledge_service:8000")
+
+# hop-by-hop headers must not be forwarded by a proxy
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade",
+              "proxy-authorization", "proxy-authenticate", "content-length", "host"}
+
+# shared pooled client; no read timeout so long-lived SSE streams aren't cut off
+client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None))
+
+
+@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def knowledge_proxy(path: str, request: Request):
+    """
+    Forward to the knowledge service, streaming both directions: uploads are not
+    buffered, and responses (including /api/answer?stream SSE) are relayed chunk by chunk.
+    """
+    upstream = client.build_request(
+        request.method,
+        f"{KNOWLEDGE_SERVICE_URL.rstrip('/')}/{path}",
+        params=request.query_params,
+        headers={k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP},
+        content=request.stream(),
+    )
+    resp = await client.send(upstream, stream=True)
+    return StreamingResponse(
+        resp.aiter_raw(),
+        status_code=resp.status_code,
+        headers={k: v for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP},
+        background=BackgroundTask(resp.aclose),
+    )
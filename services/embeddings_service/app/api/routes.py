@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from app.embeddings.providers import embed, get_batcher, get_provider
+
+router = APIRouter()
+
+class EmbeddingsIn(BaseModel):
+    texts: list[str]
+
+@router.post("/embeddings")
+async def embeddings_endpoint(payload: EmbeddingsIn):
+    try:
+        embeddings = await embed(payload.texts)
+        return {"embeddings": embeddings, "model": get_provider().name}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/embeddings/stats")
+async def embeddings_stats():
+    return {"provider": get_provider().name, "batcher": get_batcher().stats()}
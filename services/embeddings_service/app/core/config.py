@@ -7,4 +7,21 @@ class Settings:
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     MODEL_NAME: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
+    # Upstream batching: inputs are packed per call up to both limits
+    MAX_BATCH_ITEMS: int = int(os.getenv("EMBEDDING_MAX_BATCH_ITEMS", 512))
+    MAX_BATCH_TOKENS: int = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", 100000))
+    CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", 4))  # upstream calls in flight
+    MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", 5))
+    RETRY_BASE_DELAY: float = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", 0.5))
+
+    # Local CPU backend (EMBEDDING_MODEL=local:<model>) and hashing fallback
+    LOCAL_DEVICE: str = os.getenv("EMBEDDING_LOCAL_DEVICE", "cpu")
+    LOCAL_WORKERS: int = int(os.getenv("EMBEDDING_LOCAL_WORKERS", 2))
+    LOCAL_BATCH_SIZE: int = int(os.getenv("EMBEDDING_LOCAL_BATCH_SIZE", 64))
+    HASHING_DIM: int = int(os.getenv("EMBEDDING_HASHING_DIM", 384))
+
+    # Micro-batching window for coalescing concurrent requests
+    BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 256))
+    BATCH_MAX_WAIT_MS: float = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 5))
+
 settings = Settings()
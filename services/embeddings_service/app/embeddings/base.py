@@ -0,0 +1,13 @@
+class EmbeddingProvider:
+    """
+    Interface every embeddings backend implements.
+    get_embeddings must return one vector per input text, in input order.
+    """
+
+    name: str = "base"
+
+    def warm_up(self):
+        """Load whatever the backend needs up front (called at startup, off the event loop)."""
+
+    async def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError
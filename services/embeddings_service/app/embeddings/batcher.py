@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from app.core.logger import logger
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent embedding requests into larger provider calls.
+
+    The first request to arrive opens a window of `max_wait_ms`; every request
+    queued before the window closes (or until `max_batch_size` texts are
+    collected) is sent as one call, and each caller gets back its own slice.
+
+    stats() reports batch sizes and queueing delay (submit -> dispatch) over
+    the last `window` batches.
+    """
+
+    def __init__(self, embed_batch: Callable[[list[str]], Awaitable[list[list[float]]]],
+                 max_batch_size: int, max_wait_ms: float, window: int = 1000):
+        self._embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # in-flight dispatches; the loop only keeps weak references to tasks
+        self._dispatches: set = set()
+        # metrics
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.errors = 0
+        self._batch_sizes: deque = deque(maxlen=window)
+        self._queue_delays_ms: deque = deque(maxlen=window)
+
+    async def submit(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect())
+        future = loop.create_future()
+        await self._queue.put((texts, future, time.monotonic()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            items = [first]
+            size = len(first[0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0])
+            # dispatch without blocking collection so batches can overlap
+            self._start_dispatch(items)
+
+    def _start_dispatch(self, items: list):
+        task = asyncio.get_running_loop().create_task(self._dispatch(items))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def close(self):
+        """Stop collecting, send what is still queued and wait for every in-flight batch."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        items = []
+        while self._queue is not None and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        if items:
+            self._start_dispatch(items)
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def _dispatch(self, items: list):
+        texts = [t for batch, _, _ in items for t in batch]
+        now = time.monotonic()
+        self.batches += 1
+        self.requests += len(items)
+        self.texts += len(texts)
+        self._batch_sizes.append(len(texts))
+        self._queue_delays_ms.extend((now - enqueued) * 1000 for _, _, enqueued in items)
+        try:
+            vectors = await self._embed_batch(texts)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Embedding micro-batch of {len(texts)} failed: {e}")
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for batch, future, _ in items:
+            if not future.done():
+                future.set_result(vectors[offset:offset + len(batch)])
+            offset += len(batch)
+
+    def stats(self) -> dict:
+        sizes = sorted(self._batch_sizes)
+        delays = sorted(self._queue_delays_ms)
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "errors": self.errors,
+            "avg_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+            "batch_size": _summary(sizes),
+            "queue_delay_ms": _summary(delays),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+def _summary(values: list) -> dict:
+    """mean/p50/p95/max of an already sorted list."""
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "mean": sum(values) / len(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1],
+    }
@@ -0,0 +1,35 @@
+import hashlib
+
+import numpy as np
+
+from app.embeddings.base import EmbeddingProvider
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    Deterministic feature-hashing embedder (words + character trigrams, signed buckets).
+    No model, no network: meant for tests, offline development and as a last-resort
+    fallback. Texts sharing words/sub-words get positive cosine similarity.
+    """
+
+    def __init__(self, dimension: int):
+        self.name = f"hashing-{dimension}"
+        self.dimension = dimension
+
+    def _features(self, text: str) -> list[str]:
+        words = text.lower().split()
+        grams = [w[i:i + 3] for w in (f"#{w}#" for w in words) for i in range(max(1, len(w) - 2))]
+        return words + grams
+
+    def embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in self._features(text):
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dimension] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    async def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed(t) for t in texts]
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.embeddings.base import EmbeddingProvider
+
+try:
+    from sentence_transformers import SentenceTransformer
+except Exception:
+    SentenceTransformer = None
+
+
+class LocalProvider(EmbeddingProvider):
+    """
+    CPU embeddings with a sentence-transformers model (PyTorch on LOCAL_DEVICE).
+
+    Requests (already coalesced by the service's MicroBatcher) are split into
+    LOCAL_BATCH_SIZE pieces and encoded on a pool of LOCAL_WORKERS threads (the model
+    releases the GIL inside its kernels), so the event loop never blocks on inference.
+    """
+
+    def __init__(self, model_name: str):
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is not installed")
+        self.name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=settings.LOCAL_WORKERS, thread_name_prefix="embed")
+
+    def _load(self):
+        with self._model_lock:
+            if self._model is None:
+                logger.info(f"Loading local embedding model {self.name} on {settings.LOCAL_DEVICE}")
+                self._model = SentenceTransformer(self.name, device=settings.LOCAL_DEVICE)
+        return self._model
+
+    def warm_up(self):
+        # one real encode so a broken checkpoint fails at boot, not on the first request
+        self._encode_sync(["warm-up"])
+
+    def _encode_sync(self, texts: list[str]) -> list[list[float]]:
+        model = self._model or self._load()
+        return model.encode(texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True).tolist()
+
+    async def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        loop = asyncio.get_running_loop()
+        size = settings.LOCAL_BATCH_SIZE
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(self._pool, self._encode_sync, texts[i:i + size])
+            for i in range(0, len(texts), size)
+        ))
+        return [v for part in parts for v in part]
@@ -1,8 +1,17 @@
-from openai import OpenAI
+import asyncio
+import random
+
+from openai import OpenAI, AsyncOpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from app.core.config import settings
 from app.core.logger import logger
 
 client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# retries are handled below so they can back off across concurrent batches
+async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
 
 def get_embedding(text: str) -> list[float]:
     try:
@@ -14,3 +23,61 @@ def get_embedding(text: str) -> list[float]:
     except Exception as e:
         logger.error(f"Embedding generation failed: {e}")
         raise
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 chars per token for English text; good enough to stay under request limits
+    return len(text) // 4 + 1
+
+
+def _pack_batches(texts: list[str]) -> list[tuple[int, int]]:
+    """Split texts into [start, end) ranges within MAX_BATCH_ITEMS and MAX_BATCH_TOKENS."""
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        n = _estimate_tokens(text)
+        if i > start and (i - start >= settings.MAX_BATCH_ITEMS or tokens + n > settings.MAX_BATCH_TOKENS):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+async def _embed_batch(texts: list[str]) -> list[list[float]]:
+    for attempt in range(settings.MAX_RETRIES + 1):
+        try:
+            response = await async_client.embeddings.create(model=settings.MODEL_NAME, input=texts)
+            # the API may return items out of order; index refers to the input position
+            return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        except RETRYABLE_ERRORS as e:
+            if attempt == settings.MAX_RETRIES:
+                logger.error(f"Embedding batch failed after {attempt + 1} attempts: {e}")
+                raise
+            delay = settings.RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            logger.error(f"Embedding generation failed: {e}")
+            raise
+
+
+async def get_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Embed many texts: packs inputs into as few upstream calls as the item/token
+    limits allow, runs up to CONCURRENCY calls at once with retry/backoff, and
+    returns embeddings in input order.
+    """
+    if not texts:
+        return []
+
+    semaphore = asyncio.Semaphore(settings.CONCURRENCY)
+
+    async def _run(start: int, end: int) -> list[list[float]]:
+        async with semaphore:
+            return await _embed_batch(texts[start:end])
+
+    batches = _pack_batches(texts)
+    results = await asyncio.gather(*(_run(start, end) for start, end in batches))
+    return [e for batch in results for e in batch]
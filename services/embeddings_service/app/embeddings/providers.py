@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.embeddings.base import EmbeddingProvider
+from app.embeddings.batcher import MicroBatcher
+from app.embeddings.hashing_provider import HashingProvider
+
+# settings.MODEL_NAME selects the backend:
+#   "hashing" / "hashing-<dim>"                  -> HashingProvider (deterministic, offline)
+#   "local:<model>" / "sentence-transformers/..." -> LocalProvider (CPU, sentence-transformers)
+#   anything else                                 -> OpenAI embeddings API
+LOCAL_PREFIX = "local:"
+
+
+class OpenAIProvider(EmbeddingProvider):
+    def __init__(self, model_name: str):
+        self.name = model_name
+
+    def warm_up(self):
+        # fails here, at boot, when the openai package or the API key is missing
+        from app.embeddings import openai_provider  # noqa: F401
+
+    async def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # imported lazily so local/hashing setups don't need the openai package or a key
+        from app.embeddings import openai_provider
+        return await openai_provider.get_embeddings(texts)
+
+
+def build_provider(model_name: str) -> EmbeddingProvider:
+    if model_name == "hashing" or model_name.startswith("hashing-"):
+        dim = model_name.split("-", 1)[1] if "-" in model_name else settings.HASHING_DIM
+        return HashingProvider(int(dim))
+
+    if model_name.startswith(LOCAL_PREFIX) or model_name.startswith("sentence-transformers/"):
+        from app.embeddings.local_provider import LocalProvider
+        name = model_name[len(LOCAL_PREFIX):] if model_name.startswith(LOCAL_PREFIX) else model_name
+        # no fallback: vectors from another embedder would silently mix with the stored ones
+        return LocalProvider(name)
+
+    return OpenAIProvider(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_provider() -> EmbeddingProvider:
+    provider = build_provider(settings.MODEL_NAME)
+    logger.info(f"Embeddings provider: {provider.name}")
+    return provider
+
+
+@lru_cache(maxsize=None)
+def get_batcher() -> MicroBatcher:
+    """Process-wide micro-batcher in front of the selected provider."""
+    return MicroBatcher(get_provider().get_embeddings, settings.BATCH_MAX_SIZE, settings.BATCH_MAX_WAIT_MS)
+
+
+async def close_batcher():
+    """On shutdown: finish the batches still queued or in flight, if the batcher was ever used."""
+    if get_batcher.cache_info().currsize:
+        await get_batcher().close()
+
+
+async def embed(texts: list[str]) -> list[list[float]]:
+    """Embed through the micro-batcher, or directly when BATCH_MAX_WAIT_MS <= 0."""
+    if settings.BATCH_MAX_WAIT_MS <= 0:
+        return await get_provider().get_embeddings(texts)
+    return await get_batcher().submit(texts)
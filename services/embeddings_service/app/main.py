@@ -1,7 +1,24 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from app.api.routes import router as api_router
+from app.embeddings.providers import close_batcher, get_provider
 
-app = FastAPI(title="CortexOS Embeddings Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # build the provider and load its model now: a bad MODEL_NAME or checkpoint stops the boot
+    await asyncio.to_thread(get_provider().warm_up)
+    yield
+    # callers waiting on a micro-batch get their vectors before the process exits
+    await close_batcher()
+
+
+app = FastAPI(title="CortexOS Embeddings Service", lifespan=lifespan)
 
 @app.get("/health")
 def health_check():
     return {"status": "ok", "service": "embeddings_service"}
+
+# Mount API routes
+app.include_router(api_router, prefix="/api")
@@ -1,9 +1,18 @@
 # services/knowledge_service/app/api/routes.py
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
-from app.core.rag import ingest_text, semantic_search, build_prompt
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import json
+from pydantic import BaseModel, ValidationError
+from app.core.chunker import CHUNK_STRATEGIES
+from app.core.rag import ingest_text, ingest_stream, semantic_search, semantic_search_batch, build_prompt
 from app.core.config import settings
+from app.core.http_clients import orchestrator_http
+from app.core.embedding_cache import query_embedding_cache
+from app.core.reranker import RERANK_METHODS, reranker
+from app.core.search_filter import SearchFilter
+from app.core.vector_store import SEARCH_MODES
 
 router = APIRouter()
 
@@ -11,40 +20,99 @@ router = APIRouter()
 async def health():
     return {"status": "ok"}
 
+@router.get("/api/cache/stats")
+async def cache_stats():
+    return {"query_embeddings": query_embedding_cache.stats(), "rerank": reranker.cache.stats()}
+
 @router.post("/api/ingest")
-async def ingest_endpoint(source: Optional[str] = Form(None), file: Optional[UploadFile] = File(None), text: Optional[str] = Form(None)):
+async def ingest_endpoint(source: Optional[str] = Form(None), file: Optional[UploadFile] = File(None), text: Optional[str] = Form(None),
+                          chunking: Optional[str] = Form(None), metadata: Optional[str] = Form(None)):
     """
     Ingest raw text or uploaded file.
+    `chunking` selects the chunking strategy (chars, tokens, sentences, recursive).
+    `metadata` is a JSON object stored on every chunk, usable in query filters.
     Returns a doc_id.
     """
     if not file and not text:
         raise HTTPException(status_code=400, detail="Provide file or text")
-
-    if file:
-        raw = await file.read()
-        try:
-            content = raw.decode("utf-8")
-        except Exception:
-            content = raw.decode("latin-1", errors="ignore")
-        src = source or file.filename
-    else:
-        content = text
-        src = source or "text_input"
+    if chunking and chunking not in CHUNK_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"chunking must be one of {', '.join(CHUNK_STRATEGIES)}")
+    doc_metadata = _parse_metadata(metadata)
 
     try:
-        doc_id = ingest_text(content, source=src)
+        if file:
+            # stream the upload through the chunker instead of reading it whole
+            doc_id = await ingest_stream(_read_upload(file), source=source or file.filename, metadata=doc_metadata,
+                                         strategy=chunking)
+        else:
+            doc_id = await ingest_text(text, source=source or "text_input", metadata=doc_metadata, strategy=chunking)
         return {"status": "ok", "doc_id": doc_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _read_upload(file: UploadFile):
+    while True:
+        data = await file.read(settings.UPLOAD_READ_SIZE)
+        if not data:
+            break
+        yield data
+
+
+def _parse_metadata(metadata: Optional[str]) -> Optional[dict]:
+    if not metadata:
+        return None
+    try:
+        value = json.loads(metadata)
+    except ValueError:
+        value = None
+    if not isinstance(value, dict):
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+    return value
+
+
+def _check_mode(mode: Optional[str]):
+    if mode and mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SEARCH_MODES)}")
+
+
+def _check_rerank(rerank: Optional[str], rerank_candidates: Optional[int]):
+    if rerank and rerank not in RERANK_METHODS:
+        raise HTTPException(status_code=400, detail=f"rerank must be one of {', '.join(RERANK_METHODS)}")
+    if rerank_candidates is not None and rerank_candidates <= 0:
+        raise HTTPException(status_code=400, detail="rerank_candidates must be positive")
+
+
+def _parse_filters(filters: Optional[str]) -> Optional[SearchFilter]:
+    """
+    `filters` is JSON, e.g. {"source": ["a.pdf", "b.pdf"], "metadata": {"tenant": "acme"},
+    "ingested_after": "2024-01-01T00:00:00Z", "ingested_before": "2024-02-01T00:00:00Z"}.
+    """
+    if not filters:
+        return None
+    try:
+        return SearchFilter.model_validate_json(filters)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"invalid filters: {e.errors(include_url=False, include_context=False)}")
+
+
 @router.post("/api/query")
-async def query_endpoint(query: str = Form(...), top_k: int = Form(5), instruction: Optional[str] = Form(None)):
+async def query_endpoint(query: str = Form(...), top_k: int = Form(5), instruction: Optional[str] = Form(None),
+                         mode: Optional[str] = Form(None), filters: Optional[str] = Form(None),
+                         rerank: Optional[str] = Form(None), rerank_candidates: Optional[int] = Form(None)):
     """
     Run semantic search and return contexts.
+    `mode` selects vector, lexical (BM25) or hybrid retrieval (default SEARCH_MODE).
+    `filters` (JSON) restricts the search by source, metadata and ingest time.
+    `rerank` (none, mmr, cross-encoder; default RERANK) reranks `rerank_candidates`
+    retrieved chunks down to top_k.
     """
+    _check_mode(mode)
+    _check_rerank(rerank, rerank_candidates)
+    search_filter = _parse_filters(filters)
     try:
-        results = semantic_search(query, top_k=top_k)
+        results = await semantic_search(query, top_k=top_k, mode=mode, filters=search_filter,
+                                        rerank=rerank, rerank_candidates=rerank_candidates)
         # build a simple prompt to be passed to an LLM later
         prompt = build_prompt(query, results, instruction=instruction)
         return {"results": results, "prompt": prompt}
@@ -52,33 +120,97 @@ async def query_endpoint(query: str = Form(...), top_k: int = Form(5), instructi
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class BatchQueryIn(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    mode: Optional[str] = None
+    filters: Optional[SearchFilter] = None
+    rerank: Optional[str] = None
+    rerank_candidates: Optional[int] = None
+
+
+@router.post("/api/query/batch")
+async def query_batch_endpoint(payload: BatchQueryIn):
+    """
+    Semantic search for many queries in one request (evaluation / offline jobs).
+    JSON body with `queries` (at most BATCH_QUERY_MAX) and the /api/query options, `filters`
+    as an object, shared by every query. Returns per-query results, in query order.
+    """
+    if len(payload.queries) > settings.BATCH_QUERY_MAX:
+        raise HTTPException(status_code=400, detail=f"at most {settings.BATCH_QUERY_MAX} queries per batch")
+    _check_mode(payload.mode)
+    _check_rerank(payload.rerank, payload.rerank_candidates)
+    try:
+        results = await semantic_search_batch(
+            payload.queries, top_k=payload.top_k, mode=payload.mode, filters=payload.filters,
+            rerank=payload.rerank, rerank_candidates=payload.rerank_candidates,
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/api/answer")
-async def answer_endpoint(query: str = Form(...), top_k: int = Form(5), model: Optional[str] = Form(None)):
+async def answer_endpoint(query: str = Form(...), top_k: int = Form(5), model: Optional[str] = Form(None),
+                          stream: bool = Form(False), mode: Optional[str] = Form(None),
+                          filters: Optional[str] = Form(None), rerank: Optional[str] = Form(None),
+                          rerank_candidates: Optional[int] = Form(None)):
     """
     Optional convenience endpoint:
-    - runs semantic search
+    - runs semantic search (optionally reranked, as in /api/query)
     - builds prompt
     - forwards prompt to the LLM orchestrator service (if ORCHESTRATOR_URL set)
     - returns LLM response plus contexts
+    With stream=true the response is server-sent events: a `contexts` event with
+    results + prompt, then the orchestrator's token deltas passed through as they arrive.
     """
+    _check_mode(mode)
+    _check_rerank(rerank, rerank_candidates)
+    search_filter = _parse_filters(filters)
     try:
         # search + prompt
-        results = semantic_search(query, top_k=top_k)
+        results = await semantic_search(query, top_k=top_k, mode=mode, filters=search_filter,
+                                        rerank=rerank, rerank_candidates=rerank_candidates)
         prompt = build_prompt(query, results)
 
-        orchestrator_url = os.getenv("ORCHESTRATOR_URL", None)
-        if not orchestrator_url:
+        client = orchestrator_http()
+        if client is None:
             # orchestrator not configured — return prompt & contexts only
             return {"results": results, "prompt": prompt, "llm_response": None}
 
-        # call orchestrator
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                orchestrator_url.rstrip("/") + "/api/query",
-                json={"prompt": prompt, "model": model}
+        if stream:
+            return StreamingResponse(
+                _stream_answer(client, results, prompt, model),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
             )
-            resp.raise_for_status()
-            data = resp.json()
+
+        # call orchestrator over the shared, pooled client
+        resp = await client.post(
+            settings.ORCHESTRATOR_URL.rstrip("/") + "/api/query",
+            json={"prompt": prompt, "model": model}
+        )
+        resp.raise_for_status()
+        data = resp.json()
         return {"results": results, "prompt": prompt, "llm_response": data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _stream_answer(client, results, prompt: str, model: Optional[str]):
+    yield f"event: contexts\ndata: {json.dumps({'results': results, 'prompt': prompt})}\n\n"
+    try:
+        async with client.stream(
+            "POST",
+            settings.ORCHESTRATOR_URL.rstrip("/") + "/api/query",
+            json={"prompt": prompt, "model": model, "stream": True},
+        ) as resp:
+            if resp.status_code >= 400:
+                body = await resp.aread()
+                yield f"event: error\ndata: {json.dumps({'detail': body.decode('utf-8', 'replace')})}\n\n"
+                return
+            # already SSE-framed by llm_service; pass bytes through untouched
+            async for data in resp.aiter_raw():
+                yield data
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
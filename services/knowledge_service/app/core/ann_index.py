@@ -0,0 +1,140 @@
+# services/knowledge_service/app/core/ann_index.py
+"""
+In-process approximate nearest-neighbour index for the SQLite vector store.
+
+IVF (inverted file) index over L2-normalized float32 vectors:
+- spherical k-means splits the corpus into `nlist` clusters
+- each cluster keeps the row positions (into the store's matrix) assigned to it
+- a query scores the centroids, then only the rows of the `probes` closest clusters
+
+`probes` is the recall knob: probes == nlist is an exact scan.
+The index is persisted as a .npz file next to VECTOR_DB_PATH.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.logger import logger
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, lists: List[np.ndarray], n_rows: int, last_id: int):
+        self.centroids = centroids          # (nlist, dim) float32, L2-normalized
+        self.lists = lists                  # nlist arrays of int64 row positions
+        self.n_rows = n_rows                # number of matrix rows covered by the index
+        self.last_id = last_id              # id of the last covered row (staleness check)
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    # ---------- build ----------
+    @classmethod
+    def build(cls, matrix: np.ndarray, last_id: int, nlist: int = 0, iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        Train centroids on (a sample of) the normalized matrix and assign every row.
+        nlist <= 0 picks ~sqrt(n) clusters.
+        """
+        n = matrix.shape[0]
+        if nlist <= 0:
+            nlist = max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, nlist * 64)
+        sample = matrix[rng.choice(n, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    # re-seed empty clusters with a random sample point
+                    centroids[c] = sample[rng.integers(sample_size)]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (centroids / norms).astype(np.float32)
+
+        index = cls(centroids, [np.empty(0, dtype=np.int64) for _ in range(nlist)], 0, last_id)
+        index.add(matrix, last_id)
+        logger.info(f"Built IVF index: rows={n} nlist={nlist}")
+        return index
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        out = np.empty(vectors.shape[0], dtype=np.int64)
+        for i in range(0, vectors.shape[0], batch_size):
+            out[i:i + batch_size] = np.argmax(vectors[i:i + batch_size] @ self.centroids.T, axis=1)
+        return out
+
+    def add(self, matrix: np.ndarray, last_id: int):
+        """Assign matrix rows [n_rows, len(matrix)) to their nearest centroid."""
+        new = matrix[self.n_rows:]
+        if new.shape[0] == 0:
+            return
+        positions = np.arange(self.n_rows, matrix.shape[0], dtype=np.int64)
+        assign = self._assign(new)
+        # swap in a new list-of-lists so concurrent searches keep a consistent view
+        lists = list(self.lists)
+        for c in np.unique(assign):
+            lists[c] = np.concatenate([lists[c], positions[assign == c]])
+        self.lists = lists
+        self.n_rows = matrix.shape[0]
+        self.last_id = last_id
+
+    # ---------- search ----------
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int, probes: int,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (positions, scores) of the top_k rows, best first. exclude: positions never returned."""
+        probes = max(1, min(probes, self.nlist))
+        centroid_scores = self.centroids @ query
+        if probes < self.nlist:
+            nearest = np.argpartition(-centroid_scores, probes - 1)[:probes]
+        else:
+            nearest = np.arange(self.nlist)
+        lists = self.lists
+        candidates = np.concatenate([lists[c] for c in nearest])
+        # a search racing an add() may hold a matrix snapshot older than the lists
+        candidates = candidates[candidates < matrix.shape[0]]
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        scores = matrix[candidates] @ query
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    # ---------- persistence ----------
+    def save(self, path: str):
+        sizes = np.array([len(lst) for lst in self.lists], dtype=np.int64)
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            centroids=self.centroids,
+            positions=np.concatenate(self.lists) if self.lists else np.empty(0, dtype=np.int64),
+            sizes=sizes,
+            n_rows=np.int64(self.n_rows),
+            last_id=np.int64(self.last_id),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IVFIndex"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+                positions = data["positions"]
+                lists = [positions[offsets[i]:offsets[i + 1]].copy() for i in range(len(offsets) - 1)]
+                return cls(data["centroids"], lists, int(data["n_rows"]), int(data["last_id"]))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable ANN index {path}: {e}")
+            return None
@@ -2,23 +2,68 @@
 
 # knowledge_service/app/core/chunker.py
 
-from typing import List
+import codecs
+import re
+from typing import AsyncIterator, List, Tuple
 from app.core.config import settings
+from app.core.tokenizer import Tokenizer, get_tokenizer
 
+# "chars"     fixed character windows (CHUNK_SIZE / CHUNK_OVERLAP)
+# "tokens"    fixed token windows (CHUNK_TOKENS / CHUNK_TOKEN_OVERLAP)
+# "sentences" whole sentences packed up to CHUNK_TOKENS, overlapping by whole sentences
+# "recursive" split on paragraph > line > sentence > word boundaries until pieces fit, then pack
+CHUNK_STRATEGIES = ("chars", "tokens", "sentences", "recursive")
 
-def chunk_text(text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
+RECURSIVE_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+_SENTENCE = re.compile(r".+?(?:[.!?\u3002\uff01\uff1f]+(?=\s)|\n\s*\n|$)\s*", re.S)
+
+
+def chunk_text(text: str, chunk_size: int = None, overlap: int = None, strategy: str = None) -> List[str]:
     """
     Split text into overlapping chunks.
 
     Args:
         text (str): The raw text to chunk.
-        chunk_size (int, optional): Size of each chunk. Defaults to settings.CHUNK_SIZE.
-        overlap (int, optional): Number of characters overlapping between chunks.
-                                 Defaults to settings.CHUNK_OVERLAP.
+        chunk_size (int, optional): Size of each chunk, in characters for the "chars" strategy
+                                    and tokens otherwise. Defaults to settings.CHUNK_SIZE / CHUNK_TOKENS.
+        overlap (int, optional): Overlap between chunks, same unit as chunk_size.
+                                 Defaults to settings.CHUNK_OVERLAP / CHUNK_TOKEN_OVERLAP.
+        strategy (str, optional): One of CHUNK_STRATEGIES. Defaults to settings.CHUNK_STRATEGY.
 
     Returns:
         List[str]: A list of text chunks.
     """
+    strategy = strategy or settings.CHUNK_STRATEGY
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy {strategy!r}, expected one of {CHUNK_STRATEGIES}")
+    if strategy == "chars":
+        return _chunk_chars(text, chunk_size, overlap)
+
+    if chunk_size is None:
+        chunk_size = settings.CHUNK_TOKENS
+    if overlap is None:
+        overlap = settings.CHUNK_TOKEN_OVERLAP
+
+    if chunk_size <= overlap:
+        raise ValueError("chunk_size must be larger than overlap")
+
+    tok = get_tokenizer()
+    if strategy == "tokens":
+        return _token_windows(text, chunk_size, overlap, tok)
+    if strategy == "sentences":
+        pieces = []
+        for sentence in _SENTENCE.findall(text):
+            if tok.count(sentence) > chunk_size:
+                # a single sentence longer than a chunk falls back to token windows
+                pieces.extend(_token_windows(sentence, chunk_size, 0, tok, strip=False))
+            else:
+                pieces.append(sentence)
+    else:
+        pieces = _split_recursive(text, chunk_size, RECURSIVE_SEPARATORS, tok)
+    return _merge(pieces, chunk_size, overlap, tok)
+
+
+def _chunk_chars(text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
     # Use defaults from settings if not provided
     if chunk_size is None:
         chunk_size = settings.CHUNK_SIZE
@@ -42,3 +87,138 @@ def chunk_text(text: str, chunk_size: int = None, overlap: int = None) -> List[s
         start += chunk_size - overlap
 
     return chunks
+
+
+def _token_windows(text: str, chunk_size: int, overlap: int, tok: Tokenizer, strip: bool = True) -> List[str]:
+    tokens = tok.encode(text)
+    out = []
+    for start in range(0, len(tokens), chunk_size - overlap):
+        chunk = tok.decode(tokens[start:start + chunk_size])
+        if strip:
+            chunk = chunk.strip()
+        if chunk:
+            out.append(chunk)
+        if start + chunk_size >= len(tokens):
+            break
+    return out
+
+
+def _split_recursive(text: str, max_tokens: int, separators: List[str], tok: Tokenizer) -> List[str]:
+    """Split on the coarsest separator that yields pieces of at most max_tokens."""
+    if tok.count(text) <= max_tokens:
+        return [text]
+    sep, rest = separators[0], separators[1:]
+    if not sep:
+        return _token_windows(text, max_tokens, 0, tok, strip=False)
+    parts = text.split(sep)
+    out = []
+    for i, part in enumerate(parts):
+        # keep the separator attached so merged chunks read naturally
+        piece = part + sep if i < len(parts) - 1 else part
+        if not piece:
+            continue
+        if tok.count(piece) <= max_tokens:
+            out.append(piece)
+        else:
+            out.extend(_split_recursive(piece, max_tokens, rest, tok))
+    return out
+
+
+def _merge(pieces: List[str], max_tokens: int, overlap: int, tok: Tokenizer) -> List[str]:
+    """Pack consecutive pieces into chunks of at most max_tokens, carrying up to `overlap` tokens of trailing pieces."""
+    chunks = []
+    window: List[Tuple[str, int]] = []
+    window_tokens = 0
+    for piece in pieces:
+        n = tok.count(piece)
+        if window and window_tokens + n > max_tokens:
+            chunks.append("".join(p for p, _ in window).strip())
+            carry: List[Tuple[str, int]] = []
+            carried = 0
+            for p, m in reversed(window):
+                if carried + m > overlap:
+                    break
+                carry.insert(0, (p, m))
+                carried += m
+            window, window_tokens = carry, carried
+            while window and window_tokens + n > max_tokens:
+                window_tokens -= window.pop(0)[1]
+        window.append((piece, n))
+        window_tokens += n
+    if window:
+        chunks.append("".join(p for p, _ in window).strip())
+    return [c for c in chunks if c]
+
+
+async def iter_chunks(stream: AsyncIterator[bytes], chunk_size: int = None, overlap: int = None,
+                      strategy: str = None) -> AsyncIterator[str]:
+    """
+    Streaming variant of chunk_text for large uploads.
+
+    Consumes an async byte stream, decodes UTF-8 incrementally (multi-byte characters
+    split across reads are handled; invalid bytes become U+FFFD) and yields the same
+    overlapping chunks chunk_text would produce for the decoded text, while holding
+    at most about one read plus one chunk in memory.
+
+    Boundary-aware strategies are applied per section of roughly STREAM_SECTION_CHARS,
+    cut at a paragraph (or line, or word) break, so no overlap is carried across sections.
+    """
+    strategy = strategy or settings.CHUNK_STRATEGY
+    if strategy != "chars":
+        async for chunk in _iter_sections(stream, chunk_size, overlap, strategy):
+            yield chunk
+        return
+
+    if chunk_size is None:
+        chunk_size = settings.CHUNK_SIZE
+    if overlap is None:
+        overlap = settings.CHUNK_OVERLAP
+
+    if chunk_size <= overlap:
+        raise ValueError("chunk_size must be larger than overlap")
+
+    step = chunk_size - overlap
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    start = 0  # current window start within buffer
+
+    async for data in stream:
+        # drop consumed text once per read rather than once per chunk
+        buffer = buffer[start:] + decoder.decode(data)
+        start = 0
+        while len(buffer) - start >= chunk_size:
+            chunk = buffer[start:start + chunk_size].strip()
+            if chunk:
+                yield chunk
+            start += step
+
+    buffer = buffer[start:] + decoder.decode(b"", final=True)
+    start = 0
+    while start < len(buffer):
+        chunk = buffer[start:start + chunk_size].strip()
+        if chunk:
+            yield chunk
+        start += step
+
+
+async def _iter_sections(stream: AsyncIterator[bytes], chunk_size: int, overlap: int, strategy: str) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    section_chars = settings.STREAM_SECTION_CHARS
+    buffer = ""
+    async for data in stream:
+        buffer += decoder.decode(data)
+        while len(buffer) >= section_chars:
+            cut = -1
+            for sep in ("\n\n", "\n", " "):
+                cut = buffer.rfind(sep, section_chars // 2, section_chars)
+                if cut != -1:
+                    cut += len(sep)
+                    break
+            if cut == -1:
+                cut = section_chars
+            for chunk in chunk_text(buffer[:cut], chunk_size, overlap, strategy):
+                yield chunk
+            buffer = buffer[cut:]
+    buffer += decoder.decode(b"", final=True)
+    for chunk in chunk_text(buffer, chunk_size, overlap, strategy):
+        yield chunk
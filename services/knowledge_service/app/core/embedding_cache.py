@@ -0,0 +1,182 @@
+# services/knowledge_service/app/core/embedding_cache.py
+"""
+Query-embedding cache.
+
+Keys are sha256(model + normalized text), so the same question asked with different
+spacing hits the same entry, and a model change on the embeddings service never serves
+stale vectors (callers pass the served model, see embeddings_client.embedding_model).
+
+- in-process LRU with TTL (per worker)
+- optional shared SQLite file (EMBEDDING_CACHE_PATH) so all workers on a host
+  benefit from each other's misses
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import logger
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_hash(text: str, model: Optional[str] = None) -> str:
+    """Content address of a text for a given embedding model (query cache key, chunk dedup key)."""
+    model = model or settings.EMBEDDING_MODEL
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, model: str, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._puts = 0
+        if path:
+            self._open_disk(path)
+
+    def _open_disk(self, path: str):
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=0.5)
+            # WAL lets several workers read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """)
+            conn.commit()
+            self._conn = conn
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache file {path} unavailable, using memory only: {e}")
+
+    def key(self, text: str, model: Optional[str] = None) -> str:
+        return content_hash(text, model or self.model)
+
+    def get(self, text: str, model: Optional[str] = None) -> Optional[List[float]]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            return self._get(self.key(text, model), time.time())
+
+    def get_many(self, texts: List[str], model: Optional[str] = None) -> List[Optional[List[float]]]:
+        """get() for each text, under one lock acquisition (a single to_thread hop for callers)."""
+        if self.max_entries <= 0:
+            return [None] * len(texts)
+        now = time.time()
+        with self._lock:
+            return [self._get(self.key(t, model), now) for t in texts]
+
+    def _get(self, k: str, now: float) -> Optional[List[float]]:
+        entry = self._entries.get(k)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(k)
+                self.hits += 1
+                return entry[1]
+            del self._entries[k]
+
+        vector = self._disk_get(k, now)
+        if vector is not None:
+            self._remember(k, vector, now)
+            self.hits += 1
+            self.disk_hits += 1
+            return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, vector: List[float], model: Optional[str] = None):
+        self.put_many([(text, vector)], model)
+
+    def put_many(self, items: List[Tuple[str, List[float]]], model: Optional[str] = None):
+        """put() for each (text, vector), committed to the shared file in one transaction."""
+        if self.max_entries <= 0 or not items:
+            return
+        now = time.time()
+        entries = [(self.key(text, model), vector) for text, vector in items]
+        with self._lock:
+            for k, vector in entries:
+                self._remember(k, vector, now)
+            self._disk_put(entries, now)
+
+    def _remember(self, k: str, vector: List[float], now: float):
+        self._entries[k] = (now + self.ttl, vector)
+        self._entries.move_to_end(k)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ---------- shared file backend ----------
+    def _disk_get(self, k: str, now: float) -> Optional[List[float]]:
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute(
+                "SELECT embedding FROM embedding_cache WHERE key = ? AND expires_at > ?", (k, now)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return np.frombuffer(row[0], dtype="<f4").tolist() if row else None
+
+    def _disk_put(self, entries: List[Tuple[str, List[float]]], now: float):
+        if self._conn is None:
+            return
+        try:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, embedding, expires_at) VALUES (?, ?, ?)",
+                [(k, np.asarray(vector, dtype="<f4").tobytes(), now + self.ttl) for k, vector in entries]
+            )
+            before, self._puts = self._puts, self._puts + len(entries)
+            if self._puts // 1000 != before // 1000:
+                self._disk_prune(now)
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # a busy/locked cache file must never fail the query
+            logger.warning(f"Embedding cache write skipped: {e}")
+
+    def _disk_prune(self, now: float):
+        self._conn.execute("DELETE FROM embedding_cache WHERE expires_at <= ?", (now,))
+        limit = settings.EMBEDDING_CACHE_DISK_MAX_ENTRIES
+        self._conn.execute(
+            "DELETE FROM embedding_cache WHERE key IN ("
+            " SELECT key FROM embedding_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (limit,)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "shared": self._conn is not None,
+            }
+
+
+query_embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_SIZE,
+    ttl_seconds=settings.EMBEDDING_CACHE_TTL,
+    model=settings.EMBEDDING_MODEL,
+    path=settings.EMBEDDING_CACHE_PATH,
+)
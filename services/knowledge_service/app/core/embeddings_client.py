@@ -1,50 +1,98 @@
 # app/embeddings_client.py
 
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 import asyncio
 import os
 import httpx
 from app.core.config import settings
+from app.core.http_clients import embeddings_http
 
 EMBEDDINGS_PATH = "/api/embeddings"  # endpoint at embeddings service expected
 EMBEDDINGS_URL = os.getenv("EMBEDDING_SERVICE_URL", settings.EMBEDDING_SERVICE_URL)
 DEFAULT_TIMEOUT = 30.0
 BATCH_SIZE = int(os.getenv("EMBEDDINGS_BATCH_SIZE", 32))
+CONCURRENCY = int(os.getenv("EMBEDDINGS_CONCURRENCY", 4))  # batches in flight at once
+
+# model the embeddings service reports serving; None until it has been asked
+_served_model: Optional[str] = None
 
 
 async def _post_embeddings(client: httpx.AsyncClient, texts: List[str]) -> List[List[float]]:
     """
     Internal helper to call the embeddings service with a batch of texts.
-    Expects response: {"embeddings": [[...], [...]]}
+    Expects response: {"embeddings": [[...], [...]], "model": "..."}
     """
-    url = f"{EMBEDDINGS_URL}{EMBEDDINGS_PATH}"
+    global _served_model
+    url = f"{EMBEDDINGS_URL.rstrip('/')}{EMBEDDINGS_PATH}"
     r = await client.post(url, json={"texts": texts}, timeout=DEFAULT_TIMEOUT)
     r.raise_for_status()
     data = r.json()
+    # follow a model change on the service side
+    _served_model = data.get("model") or _served_model
     # support both {"embeddings": [...]} and {"embedding": ...} patterns
     return data.get("embeddings") or data.get("embedding")
 
 
-async def get_embeddings(texts: List[str], batch_size: int = BATCH_SIZE) -> List[List[float]]:
+async def iter_embeddings(
+    texts: List[str], batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY
+) -> AsyncIterator[Tuple[int, List[List[float]]]]:
     """
-    Batch-safe embeddings fetcher. Returns embeddings in the same order as texts.
+    Embed texts in batches, at most `concurrency` requests in flight.
+    Yields (offset, embeddings) for each batch as soon as it completes — NOT in input order;
+    offset is the index of the batch's first text in `texts`.
     """
     if not texts:
-        return []
+        return
+
+    semaphore = asyncio.Semaphore(concurrency)
+    client = embeddings_http()
 
-    embeddings: List[List[float]] = []
-    async with httpx.AsyncClient() as client:
-        # chunk texts into batches
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+    async def _run(offset: int) -> Tuple[int, List[List[float]]]:
+        batch = texts[offset:offset + batch_size]
+        async with semaphore:
             try:
                 batch_emb = await _post_embeddings(client, batch)
             except httpx.HTTPError as e:
                 # raise a clear runtime error for upstream handling
                 raise RuntimeError(f"Embeddings service failed: {e}") from e
-            embeddings.extend(batch_emb)
-            # small sleep to avoid bursting if many batches (adjust if needed)
-            await asyncio.sleep(0.01)
+        if not batch_emb or len(batch_emb) != len(batch):
+            raise RuntimeError("Embeddings service returned invalid response")
+        return offset, batch_emb
+
+    tasks = [asyncio.create_task(_run(i)) for i in range(0, len(texts), batch_size)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        # on error or early exit, don't leave batches running against the service
+        for t in tasks:
+            t.cancel()
+
+
+async def embedding_model() -> str:
+    """
+    Name of the model the embeddings service actually serves (part of content hashes and
+    query-cache keys). Asked once, then kept current from embedding responses;
+    settings.EMBEDDING_MODEL only when the service does not report it.
+    """
+    global _served_model
+    if _served_model is None:
+        try:
+            r = await embeddings_http().get(f"{EMBEDDINGS_URL.rstrip('/')}{EMBEDDINGS_PATH}/stats", timeout=DEFAULT_TIMEOUT)
+            r.raise_for_status()
+            _served_model = r.json().get("provider") or settings.EMBEDDING_MODEL
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Embeddings service failed: {e}") from e
+    return _served_model
+
+
+async def get_embeddings(texts: List[str], batch_size: int = BATCH_SIZE) -> List[List[float]]:
+    """
+    Batch-safe embeddings fetcher. Returns embeddings in the same order as texts.
+    """
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    async for offset, batch_emb in iter_embeddings(texts, batch_size=batch_size):
+        embeddings[offset:offset + len(batch_emb)] = batch_emb
     return embeddings
 
 
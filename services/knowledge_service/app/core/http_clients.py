@@ -0,0 +1,56 @@
+# services/knowledge_service/app/core/http_clients.py
+"""
+Application-lifetime, pooled HTTP clients for downstream services.
+
+Clients are created in the FastAPI lifespan hook (see app/main.py) and reused by
+every request, so connections (and TLS sessions) to the embeddings service and
+the LLM orchestrator stay alive between queries. Outside the app (scripts) they
+are created lazily on first use.
+"""
+
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _new_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=settings.HTTP_TIMEOUT, http2=settings.HTTP2)
+
+
+def _get(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _new_client()
+    return client
+
+
+def embeddings_http() -> httpx.AsyncClient:
+    """Pooled client for the embeddings service."""
+    return _get("embeddings")
+
+
+def orchestrator_http() -> Optional[httpx.AsyncClient]:
+    """Pooled client for the LLM orchestrator, or None if ORCHESTRATOR_URL is not set."""
+    if not settings.ORCHESTRATOR_URL:
+        return None
+    return _get("orchestrator")
+
+
+async def init_clients():
+    embeddings_http()
+    orchestrator_http()
+
+
+async def close_clients():
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
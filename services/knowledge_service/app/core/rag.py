@@ -1,65 +1,203 @@
 # knowledge_service/app/core/rag.py
 
 # services/knowledge_service/app/core/rag.py
-from typing import List, Dict, Any
+from typing import AsyncIterator, Iterable, List, Dict, Any
+import asyncio
 import uuid
-import os
-from app.core.chunker import chunk_text
-from app.core.embeddings_client import get_embedding, get_embeddings
-from app.core.vector_store import VectorStore
+from app.core.chunker import chunk_text, iter_chunks
 from app.core.config import settings
-import httpx
+from app.core.tokenizer import count_tokens
+from app.core.embeddings_client import embedding_model, get_embedding, iter_embeddings
+from app.core.embedding_cache import content_hash, query_embedding_cache
+from app.core.reranker import reranker
+from app.core.search_filter import SearchFilter
+from app.core.vector_store import VectorStore
 
 vector_store = VectorStore()
 
-def ingest_text(text: str, source: str = None, metadata: Dict[str, Any] | None = None) -> str:
+async def ingest_text(text: str, source: str = None, metadata: Dict[str, Any] | None = None,
+                      strategy: str | None = None) -> str:
+    """Ingest raw text (see ingest_chunks), chunked with `strategy`. Returns generated doc_id"""
+    return await ingest_chunks(_aiter(chunk_text(text, strategy=strategy)), source=source, metadata=metadata)
+
+
+async def ingest_stream(stream: AsyncIterator[bytes], source: str = None, metadata: Dict[str, Any] | None = None,
+                        strategy: str | None = None) -> str:
+    """
+    Ingest a UTF-8 byte stream (e.g. an upload) with bounded memory: chunks are produced
+    incrementally and embedded/stored in groups of INGEST_GROUP_SIZE. Returns generated doc_id
     """
-    Ingest raw text:
-    - chunk text
-    - call embeddings service
-    - store chunks + embeddings in vector store
+    return await ingest_chunks(iter_chunks(stream, strategy=strategy), source=source, metadata=metadata)
+
+
+async def ingest_chunks(chunks: AsyncIterator[str], source: str = None, metadata: Dict[str, Any] | None = None) -> str:
+    """
+    Ingest chunks as an upsert of `source`:
+    - content-hash each chunk (served embedding model + normalized text)
+    - chunks already stored under this source keep their row and vector; only their metadata is updated
+    - chunks whose hash is stored elsewhere reuse that vector (no embeddings call)
+    - only new/changed chunks are embedded, in concurrent batches, and stored as batches complete
+    - chunks of this source that are no longer in the text are deleted
     Returns generated doc_id
     """
     doc_id = str(uuid.uuid4())
     source_name = source or doc_id
-    # chunk
-    chunks = chunk_text(text)
-    # get embeddings (batch)
-    # embeddings_client expects full URL configured in settings
-    embeddings = None
-    # since get_embeddings is async, we call it synchronously via httpx here to keep
-    # this function sync (fast fallback). If you want purely async, refactor accordingly.
-    # For now call embeddings service directly (POST).
-    emb_url = os.getenv("EMBEDDING_SERVICE_URL", settings.EMBEDDING_SERVICE_URL)
-    # assume embeddings endpoint is /api/embeddings
-    endpoint = emb_url.rstrip("/") + "/api/embeddings"
-    resp = httpx.post(endpoint, json={"texts": chunks}, timeout=30.0)
-    resp.raise_for_status()
-    data = resp.json()
-    embeddings = data.get("embeddings", [])
-    if not embeddings or len(embeddings) != len(chunks):
-        raise RuntimeError("Embeddings service returned invalid response")
-
-    # optional metadatas list
-    metadatas = [{"source": source_name} for _ in chunks]
-
-    vector_store.add(source_name, chunks, embeddings, metadatas)
+
+    # store reads/writes are blocking DB calls; keep them off the event loop
+    present = await asyncio.to_thread(vector_store.source_hashes, source_name)
+    seen: set = set()
+
+    group: List[str] = []
+    async for chunk in chunks:
+        group.append(chunk)
+        if len(group) >= settings.INGEST_GROUP_SIZE:
+            await _ingest_group(source_name, group, present, seen, metadata)
+            group = []
+    await _ingest_group(source_name, group, present, seen, metadata)
+
+    stale = [row_id for h, ids in present.items() if h not in seen for row_id in ids]
+    await asyncio.to_thread(vector_store.delete_ids, stale)
+    # unchanged chunks take the metadata of this ingest, like the new ones
+    kept = [row_id for h, ids in present.items() if h in seen for row_id in ids]
+    if kept:
+        await asyncio.to_thread(vector_store.update_metadata, kept, _chunk_metadata(source_name, metadata))
 
     return doc_id
 
 
-def semantic_search(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+async def _ingest_group(source_name: str, chunks: List[str], present: Dict[Any, List[int]], seen: set,
+                        metadata: Dict[str, Any] | None = None):
+    if not chunks:
+        return
+    model = await embedding_model()
+    hashes = [content_hash(c, model) for c in chunks]
+    seen.update(hashes)
+    pending = [i for i, h in enumerate(hashes) if h not in present]
+
+    known = await asyncio.to_thread(vector_store.embeddings_for_hashes, {hashes[i] for i in pending})
+    reused = [i for i in pending if hashes[i] in known]
+    await _store_chunks(source_name, chunks, hashes, reused, [known[hashes[i]] for i in reused], metadata)
+
+    # embed each distinct new hash once, then fan out to every chunk carrying it
+    by_hash: Dict[str, List[int]] = {}
+    for i in pending:
+        if hashes[i] not in known:
+            by_hash.setdefault(hashes[i], []).append(i)
+    keys = list(by_hash)
+    async for offset, embeddings in iter_embeddings([chunks[by_hash[k][0]] for k in keys]):
+        idx, vecs = [], []
+        for k, e in zip(keys[offset:offset + len(embeddings)], embeddings):
+            idx.extend(by_hash[k])
+            vecs.extend([e] * len(by_hash[k]))
+        await _store_chunks(source_name, chunks, hashes, idx, vecs, metadata)
+
+
+async def _aiter(items: Iterable[str]) -> AsyncIterator[str]:
+    for item in items:
+        yield item
+
+
+def _chunk_metadata(source_name: str, metadata: Dict[str, Any] | None) -> Dict[str, Any]:
+    # document metadata (filterable at query time) on every chunk
+    return {**(metadata or {}), "source": source_name}
+
+
+async def _store_chunks(source_name: str, chunks: List[str], hashes: List[str], idx: List[int], embeddings: List[Any],
+                        metadata: Dict[str, Any] | None = None):
+    if not idx:
+        return
+    metadatas = [_chunk_metadata(source_name, metadata) for _ in idx]
+    await asyncio.to_thread(
+        vector_store.add, source_name, [chunks[i] for i in idx], embeddings, metadatas,
+        hashes=[hashes[i] for i in idx],
+    )
+
+
+async def semantic_search(query: str, top_k: int = 5, mode: str | None = None,
+                          filters: SearchFilter | None = None, rerank: str | None = None,
+                          rerank_candidates: int | None = None) -> List[Dict[str, Any]]:
     """
     Return top_k chunks (with score & metadata) for a query string.
+    mode: "vector", "lexical" or "hybrid" (default settings.SEARCH_MODE); lexical needs no embedding.
+    filters: restrict the search to matching chunks (source, metadata, ingest time).
+    rerank: "none", "mmr" or "cross-encoder" (default settings.RERANK): retrieve
+    `rerank_candidates` chunks (default settings.RERANK_CANDIDATES) and keep the top_k best.
+    """
+    mode = vector_store.search_mode(mode, query)
+    rerank = rerank or settings.RERANK
+    fetch = top_k if rerank == "none" else max(top_k, rerank_candidates or settings.RERANK_CANDIDATES)
+    query_emb = None
+    if mode != "lexical":
+        # the cache may hit its shared SQLite file: keep it off the event loop
+        model = await embedding_model()
+        query_emb = await asyncio.to_thread(query_embedding_cache.get, query, model)
+        if query_emb is None:
+            query_emb = await get_embedding(query)
+            await asyncio.to_thread(query_embedding_cache.put, query, query_emb, model)
+
+    results = await asyncio.to_thread(
+        vector_store.search, query_emb, top_k=fetch, query_text=query, mode=mode, filters=filters
+    )
+    out = _as_results(results)
+    if rerank != "none":
+        out = await asyncio.to_thread(reranker.rerank, rerank, query, query_emb, out, top_k, vector_store)
+    return out
+
+
+async def semantic_search_batch(queries: List[str], top_k: int = 5, mode: str | None = None,
+                                filters: SearchFilter | None = None, rerank: str | None = None,
+                                rerank_candidates: int | None = None) -> List[List[Dict[str, Any]]]:
+    """
+    semantic_search for many queries, results in query order.
+    Query embeddings missing from the cache are fetched together (batched embeddings
+    calls, each distinct text once), and vector-mode queries are scored by the store in
+    one pass (search_batch); lexical / hybrid queries are searched one by one.
     """
-    emb_url = os.getenv("EMBEDDING_SERVICE_URL", settings.EMBEDDING_SERVICE_URL)
-    endpoint = emb_url.rstrip("/") + "/api/embeddings"
-    resp = httpx.post(endpoint, json={"texts": [query]}, timeout=10.0)
-    resp.raise_for_status()
-    data = resp.json()
-    query_emb = data.get("embeddings", [])[0]
-
-    results = vector_store.search(query_emb, top_k=top_k)
+    rerank = rerank or settings.RERANK
+    fetch = top_k if rerank == "none" else max(top_k, rerank_candidates or settings.RERANK_CANDIDATES)
+    modes = [vector_store.search_mode(mode, q) for q in queries]
+
+    embeddings: List[Any] = [None] * len(queries)
+    wanted = [i for i, m in enumerate(modes) if m != "lexical"]
+    # one thread hop for the whole batch's cache reads, one for its writes
+    model = await embedding_model() if wanted else None
+    cached = await asyncio.to_thread(query_embedding_cache.get_many, [queries[i] for i in wanted], model)
+    missing: Dict[str, List[int]] = {}
+    for i, e in zip(wanted, cached):
+        embeddings[i] = e
+        if e is None:
+            missing.setdefault(queries[i], []).append(i)
+    texts = list(missing)
+    fetched = []
+    async for offset, batch in iter_embeddings(texts):
+        for q, e in zip(texts[offset:offset + len(batch)], batch):
+            fetched.append((q, e))
+            for i in missing[q]:
+                embeddings[i] = e
+    await asyncio.to_thread(query_embedding_cache.put_many, fetched, model)
+
+    def search_all() -> List[Any]:
+        results: List[Any] = [None] * len(queries)
+        vector = [i for i, m in enumerate(modes) if m == "vector"]
+        if vector:
+            batch = vector_store.search_batch([embeddings[i] for i in vector], top_k=fetch, filters=filters)
+            for i, r in zip(vector, batch):
+                results[i] = r
+        for i, m in enumerate(modes):
+            if m != "vector":
+                results[i] = vector_store.search(
+                    embeddings[i], top_k=fetch, query_text=queries[i], mode=m, filters=filters
+                )
+        out = [_as_results(r) for r in results]
+        if rerank != "none":
+            out = [reranker.rerank(rerank, q, e, o, top_k, vector_store) for q, e, o in zip(queries, embeddings, out)]
+        return out
+
+    # store scans and reranking are blocking; keep them off the event loop
+    return await asyncio.to_thread(search_all)
+
+
+def _as_results(results: List[Any]) -> List[Dict[str, Any]]:
     # results are list of (docdict, score)
     out = []
     for docdict, score in results:
@@ -77,15 +215,20 @@ def build_prompt(query: str, contexts: List[Dict[str, Any]], instruction: str |
     """
     Build a prompt that concatenates the top contexts and the user query.
     Keep it simple: include contexts at the top and a short instruction.
+
+    Contexts are packed in rank order by real token count: a context that would overflow
+    max_context_tokens is skipped and smaller lower-ranked ones may still fill the budget.
     """
     header = instruction or "You are a helpful assistant. Use the context below to answer the question as best as possible.\n\nContext:\n"
     context_texts = []
-    total_len = 0
+    total_tokens = 0
     for c in contexts:
         snippet = c.get("text", "")
-        total_len += len(snippet)
-        if total_len > max_context_tokens:
-            break
+        # +1 for the newline joining entries
+        n = count_tokens(f"- {snippet}") + 1
+        if total_tokens + n > max_context_tokens:
+            continue
+        total_tokens += n
         context_texts.append(f"- {snippet}")
 
     context_blob = "\n".join(context_texts)
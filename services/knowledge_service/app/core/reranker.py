@@ -0,0 +1,187 @@
+# services/knowledge_service/app/core/reranker.py
+"""
+Optional second stage after retrieval: over-fetch candidates, rescore them, keep top_k.
+
+- "mmr": maximal marginal relevance over the candidates' stored embeddings; relevance
+  to the query is traded against similarity to the chunks already picked
+  (RERANK_MMR_LAMBDA), so near-duplicate chunks stop crowding the prompt
+- "cross-encoder": a local sentence-transformers CrossEncoder (RERANK_MODEL) scores all
+  (query, chunk) pairs in one batch; falls back to "mmr" when the package is missing
+
+Rerankings are cached per (method, query, candidate ids, top_k) in an in-process LRU
+with TTL, so a repeated question over the same candidates is not rescored.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.embedding_cache import normalize_text
+from app.core.logger import logger
+
+try:
+    from sentence_transformers import CrossEncoder
+except Exception:
+    CrossEncoder = None
+
+RERANK_METHODS = ("none", "mmr", "cross-encoder")
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, top_k: int, lam: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Greedy maximal marginal relevance over L2-normalized `vectors`.
+    Returns the picked indices and their MMR scores, in pick order.
+    """
+    n = relevance.shape[0]
+    similarity = vectors @ vectors.T
+    # similarity to the closest picked chunk (dissimilar chunks earn no bonus)
+    redundancy = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked, scores = [], []
+    for _ in range(min(top_k, n)):
+        score = lam * relevance - (1 - lam) * redundancy
+        score[~available] = -np.inf
+        j = int(np.argmax(score))
+        picked.append(j)
+        scores.append(float(score[j]))
+        available[j] = False
+        redundancy = np.maximum(redundancy, similarity[:, j])
+    return np.asarray(picked, dtype=np.int64), np.asarray(scores, dtype=np.float32)
+
+
+def _unit(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32, copy=False)
+
+
+class RerankCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, List[Tuple[int, float]]]]" = OrderedDict()
+
+    @staticmethod
+    def key(method: str, query: str, ids: List[int], top_k: int) -> str:
+        # the knob that shapes the ranking is part of the key
+        variant = settings.RERANK_MODEL if method == "cross-encoder" else settings.RERANK_MMR_LAMBDA
+        raw = f"{method}\x00{variant}\x00{normalize_text(query)}\x00{','.join(map(str, ids))}\x00{top_k}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, k: str) -> Optional[List[Tuple[int, float]]]:
+        if self.max_entries <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(k)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[k]
+            self.misses += 1
+            return None
+
+    def put(self, k: str, ranking: List[Tuple[int, float]]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[k] = (time.time() + self.ttl, ranking)
+            self._entries.move_to_end(k)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class Reranker:
+    def __init__(self, cache: RerankCache):
+        self.cache = cache
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._warned = False
+
+    def _cross_encoder(self):
+        if CrossEncoder is None:
+            if not self._warned:
+                self._warned = True
+                logger.warning("sentence-transformers is not installed; cross-encoder reranking falls back to mmr")
+            return None
+        with self._model_lock:
+            if self._model is None:
+                logger.info(f"Loading rerank model {settings.RERANK_MODEL}")
+                self._model = CrossEncoder(settings.RERANK_MODEL)
+        return self._model
+
+    def rerank(self, method: str, query: str, query_embedding: Optional[List[float]],
+               candidates: List[Dict[str, Any]], top_k: int, store) -> List[Dict[str, Any]]:
+        """
+        Best `top_k` of `candidates` (search results, best first) by `method`. Blocking
+        (model inference, embedding lookups): run it off the event loop. Each result's
+        score becomes the rerank score; the retrieval score is kept as retrieval_score.
+        """
+        if method == "none" or not candidates:
+            return candidates[:top_k]
+        model = self._cross_encoder() if method == "cross-encoder" else None
+        if model is None:
+            method = "mmr"
+
+        ids = [c["id"] for c in candidates]
+        key = self.cache.key(method, query, ids, top_k)
+        ranking = self.cache.get(key)
+        if ranking is None:
+            if model is not None:
+                scores = np.asarray(model.predict(
+                    [(query, c.get("text") or "") for c in candidates], batch_size=len(candidates)
+                ), dtype=np.float32)
+                order = np.argsort(-scores)[:top_k]
+                ranking = [(ids[i], float(scores[i])) for i in order]
+            else:
+                ranking = self._mmr(query_embedding, candidates, top_k, store)
+            self.cache.put(key, ranking)
+
+        by_id = {c["id"]: c for c in candidates}
+        return [
+            {**by_id[i], "score": score, "retrieval_score": by_id[i]["score"]}
+            for i, score in ranking if i in by_id
+        ]
+
+    @staticmethod
+    def _mmr(query_embedding: Optional[List[float]], candidates: List[Dict[str, Any]], top_k: int,
+             store) -> List[Tuple[int, float]]:
+        stored = store.embeddings_for_ids([c["id"] for c in candidates])
+        # a chunk deleted since retrieval has no embedding left; drop it
+        present = [c for c in candidates if c["id"] in stored]
+        if not present:
+            return []
+        vectors = _unit(np.vstack([np.asarray(stored[c["id"]], dtype=np.float32) for c in present]))
+        if query_embedding is not None:
+            relevance = vectors @ _unit(np.asarray(query_embedding, dtype=np.float32))
+        else:
+            # lexical search has no query vector: use the retrieval scores, scaled to [0, 1]
+            scores = np.asarray([c["score"] for c in present], dtype=np.float32)
+            spread = scores.max() - scores.min()
+            relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        picked, mmr_scores = mmr(relevance, vectors, top_k, settings.RERANK_MMR_LAMBDA)
+        return [(present[i]["id"], float(s)) for i, s in zip(picked, mmr_scores)]
+
+
+reranker = Reranker(RerankCache(settings.RERANK_CACHE_SIZE, settings.RERANK_CACHE_TTL))
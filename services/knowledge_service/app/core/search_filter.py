@@ -0,0 +1,82 @@
+# services/knowledge_service/app/core/search_filter.py
+"""
+Search filters, pushed down into SQL by both vector store backends.
+
+A chunk matches when its source is one of `source`, every `metadata` key equals the
+given value (or one of the given values, for a list), and it was ingested inside
+[ingested_after, ingested_before).
+"""
+
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, field_validator
+
+_KEY = re.compile(r"^[\w.-]+$")
+Scalar = Union[str, int, float, bool]
+
+
+class SearchFilter(BaseModel):
+    source: Optional[Union[str, List[str]]] = None
+    metadata: Dict[str, Union[Scalar, List[Scalar]]] = {}
+    ingested_after: Optional[datetime] = None
+    ingested_before: Optional[datetime] = None
+
+    @field_validator("metadata")
+    @classmethod
+    def _check_keys(cls, v):
+        for key in v:
+            if not _KEY.match(key):
+                raise ValueError(f"invalid metadata key {key!r}")
+        return v
+
+    def sources(self) -> Optional[List[str]]:
+        if self.source is None:
+            return None
+        return [self.source] if isinstance(self.source, str) else list(self.source)
+
+    def is_empty(self) -> bool:
+        return self.source is None and not self.metadata and self.ingested_after is None and self.ingested_before is None
+
+
+def as_utc(ts: datetime) -> datetime:
+    """Naive datetimes are taken as UTC."""
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def epoch(ts: datetime) -> float:
+    return as_utc(ts).timestamp()
+
+
+def sqlite_metadata_expr(key: str, column: str = "metadata") -> str:
+    # must match the expression indexes created for FILTER_INDEXED_KEYS
+    return f"json_extract({column}, '$.\"{key}\"')"
+
+
+def _sqlite_value(v: Scalar) -> Any:
+    # json_extract returns JSON true/false as 1/0
+    return int(v) if isinstance(v, bool) else v
+
+
+def sqlite_where(f: Optional[SearchFilter], table: str = "chunks") -> Tuple[str, list]:
+    """SQL condition (without WHERE) and parameters for `f`; ("1", []) when empty."""
+    if f is None or f.is_empty():
+        return "1", []
+    clauses, params = [], []
+    sources = f.sources()
+    if sources is not None:
+        clauses.append(f"{table}.source IN ({','.join('?' * len(sources))})" if sources else "0")
+        params.extend(sources)
+    for key, value in f.metadata.items():
+        expr = sqlite_metadata_expr(key, f"{table}.metadata")
+        values = value if isinstance(value, list) else [value]
+        clauses.append(f"{expr} IN ({','.join('?' * len(values))})" if values else "0")
+        params.extend(_sqlite_value(v) for v in values)
+    if f.ingested_after is not None:
+        clauses.append(f"{table}.created_at >= ?")
+        params.append(epoch(f.ingested_after))
+    if f.ingested_before is not None:
+        clauses.append(f"{table}.created_at < ?")
+        params.append(epoch(f.ingested_before))
+    return " AND ".join(clauses), params
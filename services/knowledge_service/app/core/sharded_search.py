@@ -0,0 +1,173 @@
+# services/knowledge_service/app/core/sharded_search.py
+"""
+Multi-process exact vector search for large SQLite-backed corpora.
+
+The store's normalized matrix is published as a read-only float32 snapshot file
+("<VECTOR_DB_PATH>.shards/<pid>-<generation>.f32", or the vector segment file when
+the matrix is already memory-mapped) that every worker process memory-maps, so the OS page cache holds a single copy shared by all of them.
+The rows are split into `shards` contiguous ranges (the matrix is in id order,
+so these are id ranges); each worker scores its range and returns a local top-k,
+and the parent merges them.
+
+Workers are started with "spawn" (the service is multi-threaded) and import only
+this module.
+"""
+
+import atexit
+import glob
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# (path, rows, dim, id of the last row)
+Snapshot = Tuple[Optional[str], int, int, int]
+
+# ---------- worker side ----------
+_maps: Dict[Tuple[str, int, int], np.ndarray] = {}
+
+
+def _attach(path: str, rows: int, dim: int) -> np.ndarray:
+    # keyed by shape too: the segment file keeps its path while rows are appended to it
+    key = (path, rows, dim)
+    matrix = _maps.get(key)
+    if matrix is None:
+        # a new snapshot replaces the previous mapping
+        _maps.clear()
+        matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+        _maps[key] = matrix
+    return matrix
+
+
+def top_k(scores: np.ndarray, k: int, exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and values of the k highest scores, best first, skipping the `exclude` indices."""
+    if exclude is not None and len(exclude):
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+        k = min(k, scores.shape[0] - len(exclude))
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
+def _shard_top_k(path: str, rows: int, dim: int, lo: int, hi: int, q: np.ndarray, k: int,
+                 allowed: Optional[np.ndarray], exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k matrix positions within rows [lo, hi) except `exclude` (positions in that range),
+    or within `allowed` positions when given.
+    """
+    matrix = _attach(path, rows, dim)
+    if allowed is None:
+        top, scores = top_k(matrix[lo:hi] @ q, k, None if exclude is None else exclude - lo)
+        return top + lo, scores
+    top, scores = top_k(matrix[allowed] @ q, k)
+    return allowed[top], scores
+
+
+# ---------- parent side ----------
+class ShardedSearcher:
+    def __init__(self, directory: str, shards: int):
+        self.directory = directory
+        self.shards = shards
+        self.snapshot: Snapshot = (None, 0, 0, -1)
+        self._owned: List[str] = []         # snapshot files written by this process, oldest first
+        self._generation = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def covered_rows(self, ids: np.ndarray, matrix: np.ndarray) -> int:
+        """
+        Rows of the published snapshot that are still a prefix of `matrix` (row ids `ids`);
+        0 when rows were deleted since, which shifts positions, or a mapped matrix moved files.
+        """
+        path, rows, _, last_id = self.snapshot
+        if isinstance(matrix, np.memmap) and matrix.filename != path:
+            return 0
+        if rows == 0 or rows > len(ids) or int(ids[rows - 1]) != last_id:
+            return 0
+        return rows
+
+    def publish(self, matrix: np.ndarray, last_id: int):
+        """Make `matrix` (whose last row has id `last_id`) the snapshot the workers map."""
+        if isinstance(matrix, np.memmap) and matrix.offset == 0 and matrix.filename:
+            # already a file (the vector segment): workers map it directly
+            path = matrix.filename
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            self._generation += 1
+            # the pid keeps the uvicorn workers sharing one VECTOR_DB_PATH apart
+            path = os.path.join(self.directory, f"{os.getpid()}-{self._generation}.f32")
+            np.ascontiguousarray(matrix, dtype=np.float32).tofile(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            # searches still running on the previous snapshot may yet attach to it; drop the one before
+            self._owned.append(path)
+            while len(self._owned) > 2:
+                self._remove(self._owned.pop(0))
+        self.snapshot = (path, matrix.shape[0], matrix.shape[1], last_id)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.shards, mp_context=get_context("spawn"))
+            return self._pool
+
+    def search(self, snapshot: Snapshot, limit: int, q: np.ndarray, k: int,
+               allowed: Optional[np.ndarray] = None, exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k positions (and scores) among the first `limit` rows of `snapshot`, scanning
+        the shards in parallel. allowed: ascending positions (< limit) to restrict the scan to.
+        exclude: ascending positions to skip when `allowed` is not given (tombstoned rows).
+        """
+        path, rows, dim, _ = snapshot
+        edges = np.linspace(0, limit, self.shards + 1).astype(np.int64)
+        cuts = np.searchsorted(allowed, edges) if allowed is not None else None
+        skips = np.searchsorted(exclude, edges) if exclude is not None and len(exclude) else None
+        pool = self._executor()
+        futures = []
+        for s in range(self.shards):
+            lo, hi = int(edges[s]), int(edges[s + 1])
+            part = allowed[cuts[s]:cuts[s + 1]] if allowed is not None else None
+            if hi <= lo or (part is not None and len(part) == 0):
+                continue
+            skip = exclude[skips[s]:skips[s + 1]] if skips is not None else None
+            futures.append(pool.submit(_shard_top_k, path, rows, dim, lo, hi, q, k, part, skip))
+        try:
+            results = [f.result() for f in futures]
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed): start a fresh pool on the next search
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        if not results:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions = np.concatenate([r[0] for r in results])
+        scores = np.concatenate([r[1] for r in results])
+        best, best_scores = top_k(scores, k)
+        return positions[best], best_scores
+
+    @staticmethod
+    def _remove(path: Optional[str]):
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+        for path in glob.glob(os.path.join(self.directory, f"{os.getpid()}-*.f32*")):
+            self._remove(path)
+        self.snapshot, self._owned = (None, 0, 0, -1), []
@@ -0,0 +1,53 @@
+# services/knowledge_service/app/core/tokenizer.py
+"""
+Token counting for chunking and prompt packing.
+
+Uses tiktoken (fast BPE, matches OpenAI-style models closely) when installed,
+otherwise falls back to a regex approximation (one token per word / punctuation
+run, leading whitespace attached) so the service still works without it.
+"""
+
+import re
+from functools import lru_cache
+from typing import List
+
+from app.core.config import settings
+
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+_FALLBACK_TOKEN = re.compile(r"\s*(?:\w+|[^\w\s]+)|\s+")
+
+
+class Tokenizer:
+    def __init__(self, encoding_name: str):
+        self._enc = None
+        if tiktoken is not None:
+            try:
+                self._enc = tiktoken.get_encoding(encoding_name)
+            except Exception:
+                self._enc = None
+
+    def encode(self, text: str) -> List:
+        if self._enc is not None:
+            return self._enc.encode(text, disallowed_special=())
+        return _FALLBACK_TOKEN.findall(text)
+
+    def decode(self, tokens: List) -> str:
+        if self._enc is not None:
+            return self._enc.decode(tokens)
+        return "".join(tokens)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(encoding_name: str = None) -> Tokenizer:
+    return Tokenizer(encoding_name or settings.TOKENIZER_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
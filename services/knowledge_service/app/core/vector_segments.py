@@ -0,0 +1,251 @@
+# services/knowledge_service/app/core/vector_segments.py
+"""
+Persistent, memory-mapped copy of the SQLite store's vectors.
+
+"<VECTOR_DB_PATH>.segments/" holds, per generation g:
+- g.f32      append-only L2-normalized float32 rows (fixed dimension), in id order
+- g.ids      the int64 chunk id of each row
+- g.deleted  int64 ids deleted since generation g was written (tombstones)
+and manifest.json with the committed counts, replaced atomically on every change.
+
+Workers map the files read-only instead of decoding every embedding BLOB, so they
+start in milliseconds and share one copy through the page cache. Writers hold an
+flock on "lock": sync() appends whatever SQLite has beyond the manifest's last id,
+delete() appends tombstones. Readers take it shared while they read the manifest and
+map the files it names. Once tombstones exceed `compact_ratio` of the rows, a
+background thread rewrites the live rows as generation g+1.
+
+SQLite stays the source of truth: bytes past the manifest's counts (a writer that
+died mid-append) are truncated by the next writer.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.logger import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+_EMPTY = {"generation": 0, "dim": 0, "rows": 0, "last_id": 0, "deleted": 0}
+_COMPACT_BATCH_ROWS = 65536
+
+
+class SegmentView(NamedTuple):
+    """One committed state of the files; replaced as a whole, so readers never mix generations."""
+    manifest: dict
+    matrix: Optional[np.ndarray]    # (rows, dim) memmap, None when empty
+    ids: np.ndarray                 # (rows,) chunk ids, ascending
+    deleted: np.ndarray             # tombstoned ids still present in the files
+    dead: np.ndarray                # ascending matrix positions of those ids
+
+
+_EMPTY_VIEW = SegmentView(dict(_EMPTY), None, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                          np.empty(0, dtype=np.int64))
+
+
+class VectorSegments:
+    def __init__(self, directory: str, compact_ratio: float = 0.2):
+        self.directory = directory
+        self.compact_ratio = compact_ratio
+        os.makedirs(directory, exist_ok=True)
+        self._manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.RLock()
+        self._stamp = None                  # stat of the manifest last mapped
+        self._compacting = False
+        self.view = _EMPTY_VIEW
+
+    @property
+    def manifest(self) -> dict:
+        return self.view.manifest
+
+    def _file(self, generation: int, ext: str) -> str:
+        return os.path.join(self.directory, f"{generation}.{ext}")
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize writers across threads and processes."""
+        with self._flock(fcntl.LOCK_EX if fcntl is not None else None):
+            yield
+
+    @contextmanager
+    def _shared(self):
+        """Keep writers (and compaction unlinking the old generation) out while mapping."""
+        with self._flock(fcntl.LOCK_SH if fcntl is not None else None):
+            yield
+
+    @contextmanager
+    def _flock(self, operation: Optional[int]):
+        with self._lock, open(os.path.join(self.directory, "lock"), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                return {**_EMPTY, **json.load(f)}
+        except FileNotFoundError:
+            return dict(_EMPTY)
+
+    def _write_manifest(self, manifest: dict):
+        tmp = f"{self._manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path)
+
+    @staticmethod
+    def _truncate(path: str, size: int):
+        with open(path, "ab"):
+            pass
+        os.truncate(path, size)
+
+    # ---------- readers ----------
+    def refresh(self) -> bool:
+        """Re-map the files if a writer (any process) committed since the last look. True when they changed."""
+        if self._manifest_stamp() == self._stamp:
+            return False
+        # the manifest and the generation files it names are read as one unit: once mapped,
+        # a later compaction can unlink them without breaking this view
+        with self._shared():
+            stamp = self._manifest_stamp()
+            self._map(self._read_manifest())
+            self._stamp = stamp
+        return True
+
+    def _manifest_stamp(self):
+        try:
+            st = os.stat(self._manifest_path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _map(self, manifest: dict):
+        g, rows, dim = manifest["generation"], manifest["rows"], manifest["dim"]
+        if rows:
+            matrix = np.memmap(self._file(g, "f32"), dtype="<f4", mode="r", shape=(rows, dim))
+            ids = np.memmap(self._file(g, "ids"), dtype="<i8", mode="r", shape=(rows,))
+        else:
+            matrix, ids = None, np.empty(0, dtype=np.int64)
+        n = manifest["deleted"]
+        deleted = np.fromfile(self._file(g, "deleted"), dtype="<i8", count=n) if n else np.empty(0, dtype=np.int64)
+        dead = np.flatnonzero(np.isin(ids, deleted)) if n else np.empty(0, dtype=np.int64)
+        self.view = SegmentView(manifest, matrix, ids, deleted, dead)
+
+    # ---------- writers ----------
+    def sync(self, read_after: Callable[[int], Optional[Tuple[np.ndarray, np.ndarray]]]):
+        """
+        Append the batches `read_after(last_id)` returns (ids and normalized rows beyond
+        last_id, in id order; None once caught up), then re-map.
+        """
+        with self._exclusive():
+            manifest = self._read_manifest()
+            g, rows, dim = manifest["generation"], manifest["rows"], manifest["dim"]
+            vectors, ids = self._file(g, "f32"), self._file(g, "ids")
+            self._truncate(vectors, rows * dim * 4)
+            self._truncate(ids, rows * 8)
+            appended = 0
+            with open(vectors, "ab") as fv, open(ids, "ab") as fi:
+                while True:
+                    batch = read_after(manifest["last_id"])
+                    if batch is None:
+                        break
+                    batch_ids, block = batch
+                    if manifest["dim"] == 0:
+                        manifest["dim"] = block.shape[1]
+                    elif block.shape[1] != manifest["dim"]:
+                        raise ValueError(
+                            f"Embedding dimension {block.shape[1]} does not match stored dimension {manifest['dim']}"
+                        )
+                    fv.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+                    fi.write(np.asarray(batch_ids, dtype="<i8").tobytes())
+                    manifest["rows"] += len(batch_ids)
+                    manifest["last_id"] = int(batch_ids[-1])
+                    appended += len(batch_ids)
+            if appended:
+                self._write_manifest(manifest)
+        self.refresh()
+
+    def delete(self, ids: Iterable[int]):
+        """Tombstone `ids`; their rows stay in the files (and must be skipped) until compaction."""
+        with self._exclusive():
+            manifest = self._read_manifest()
+            dead = np.asarray([i for i in ids if i <= manifest["last_id"]], dtype="<i8")
+            if len(dead):
+                path = self._file(manifest["generation"], "deleted")
+                self._truncate(path, manifest["deleted"] * 8)
+                with open(path, "ab") as f:
+                    f.write(dead.tobytes())
+                manifest["deleted"] += len(dead)
+                self._write_manifest(manifest)
+        self.refresh()
+
+    def reset(self):
+        """Start an empty generation (the database was replaced)."""
+        with self._exclusive():
+            old = self._read_manifest()
+            self._write_manifest({**_EMPTY, "generation": old["generation"] + 1})
+            self._remove_generation(old["generation"])
+        self.refresh()
+
+    def compact(self):
+        """Rewrite the live rows as the next generation and drop the old files."""
+        with self._exclusive():
+            manifest = self._read_manifest()
+            g, rows, dim = manifest["generation"], manifest["rows"], manifest["dim"]
+            if not manifest["deleted"]:
+                return
+            old_vectors = np.memmap(self._file(g, "f32"), dtype="<f4", mode="r", shape=(rows, dim))
+            old_ids = np.memmap(self._file(g, "ids"), dtype="<i8", mode="r", shape=(rows,))
+            dead = np.fromfile(self._file(g, "deleted"), dtype="<i8", count=manifest["deleted"])
+            kept = 0
+            with open(self._file(g + 1, "f32"), "wb") as fv, open(self._file(g + 1, "ids"), "wb") as fi:
+                for start in range(0, rows, _COMPACT_BATCH_ROWS):
+                    batch_ids = old_ids[start:start + _COMPACT_BATCH_ROWS]
+                    keep = ~np.isin(batch_ids, dead)
+                    fv.write(old_vectors[start:start + _COMPACT_BATCH_ROWS][keep].tobytes())
+                    fi.write(batch_ids[keep].tobytes())
+                    kept += int(keep.sum())
+            open(self._file(g + 1, "deleted"), "wb").close()
+            del old_vectors, old_ids
+            # last_id stays: it marks how far SQLite has been copied, not the last live row
+            self._write_manifest({**manifest, "generation": g + 1, "rows": kept, "deleted": 0})
+            # readers still mapping the old files keep them alive until they re-map
+            self._remove_generation(g)
+            logger.info(f"Compacted vector segment: rows={rows} -> {kept}")
+        self.refresh()
+
+    def maybe_compact(self):
+        """Compact in a background thread once tombstones pass compact_ratio of the rows."""
+        manifest = self.manifest
+        if self._compacting or not manifest["deleted"] or manifest["deleted"] < self.compact_ratio * manifest["rows"]:
+            return
+        self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                logger.warning(f"Vector segment compaction failed: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="vector-segment-compaction", daemon=True).start()
+
+    def _remove_generation(self, generation: int):
+        for ext in ("f32", "ids", "deleted"):
+            try:
+                os.remove(self._file(generation, ext))
+            except OSError:
+                pass
@@ -3,20 +3,33 @@
 Flexible Vector Store:
 - If pgvector + Postgres is available (DATABASE_URL points to Postgres && pgvector installed),
   use SQLAlchemy + pgvector for efficient search (recommended for production).
-- Otherwise fall back to a lightweight SQLite file-based store that stores vectors as CSV blobs
-  and computes cosine similarity in Python (OK for development / small corpora).
+- Otherwise fall back to a lightweight SQLite file-based store that stores vectors as float32 blobs
+  and scans a pre-normalized NumPy matrix, in memory or memory-mapped from a segment file
+  (OK for development / small-to-medium corpora).
+
+Both backends also keep a lexical index over chunk text (FTS5 BM25 / tsvector + GIN), so
+search() can run in "vector", "lexical" or "hybrid" mode (reciprocal rank fusion).
 """
 
+import atexit
 import os
+import re
 import json
-import math
-from typing import List, Tuple, Optional
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple, Optional
+
+import numpy as np
 
 # Try to detect if we can use pgvector with SQLAlchemy
 USE_PGVECTOR = False
 try:
-    from sqlalchemy import create_engine, Column, Integer, String, Text, select
-    from sqlalchemy.orm import declarative_base, sessionmaker
+    from sqlalchemy import (
+        create_engine, Column, Computed, DateTime, Integer, String, Text, cast, false, func, literal, or_, select, insert,
+        delete, update, union_all, text as sql_text,
+    )
+    from sqlalchemy.dialects.postgresql import JSONB, REGCONFIG, TSVECTOR
+    from sqlalchemy.orm import declarative_base, deferred, sessionmaker
     from pgvector.sqlalchemy import Vector
     USE_PGVECTOR = True
 except Exception:
@@ -26,6 +39,37 @@ except Exception:
 import sqlite3
 
 from app.core.config import settings
+from app.core.ann_index import IVFIndex
+from app.core.logger import logger
+from app.core.search_filter import SearchFilter, as_utc, sqlite_metadata_expr, sqlite_where
+from app.core.sharded_search import ShardedSearcher, top_k as top_k_of
+from app.core.vector_segments import VectorSegments
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+_TERM = re.compile(r"\w+")
+
+
+def lexical_terms(text: Optional[str], max_terms: int = 32) -> List[str]:
+    """Distinct lower-cased word tokens of a query; identifiers like ERR_CONN_42 stay whole."""
+    return list(dict.fromkeys(t.lower() for t in _TERM.findall(text or "")))[:max_terms]
+
+
+def search_mode(mode: Optional[str], query_text: Optional[str], lexical: bool = True) -> str:
+    """The mode a search actually runs in; lexical: the store has a lexical index."""
+    mode = (mode or settings.SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"search mode must be one of {', '.join(SEARCH_MODES)}")
+    # nothing to match lexically (or nothing to match it with): plain vector search
+    return mode if lexical and lexical_terms(query_text) else "vector"
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, limit: int) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank). Best first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row_id in enumerate(ranking, start=1):
+            scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])[:limit]
 
 # ---------- PGVECTOR implementation ----------
 if USE_PGVECTOR:
@@ -34,64 +78,357 @@ if USE_PGVECTOR:
     class ChunkRow(Base):
         __tablename__ = "chunks"
         id = Column(Integer, primary_key=True, index=True)
-        source = Column(String(255), nullable=True)
+        source = Column(String(255), nullable=True, index=True)
         text = Column(Text, nullable=False)
         meta = Column(Text, nullable=True)  # store JSON string
+        content_hash = Column(String(64), nullable=True, index=True)  # sha256(model + normalized text)
         # embedding = Column(Vector(dimensions=1536), nullable=False)  # adjust dims if needed
         embedding = Column(Vector(1536), nullable=False)
+        # maintained by Postgres on every insert; the config is fixed when the column is created
+        created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=True, index=True)
+        text_tsv = deferred(Column(
+            TSVECTOR, Computed(f"to_tsvector('{settings.LEXICAL_TS_CONFIG}'::regconfig, text)", persisted=True)
+        ))
 
 
     class PGVectorStore:
-        def __init__(self, database_url: str):
+        def __init__(self, database_url: str, ann_index: str = None):
             self.engine = create_engine(database_url, pool_pre_ping=True)
             self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
             Base.metadata.create_all(bind=self.engine)
+            self._migrate_schema()
+            self.ann_index = (ann_index or settings.ANN_INDEX).lower()
+            self._create_ann_index()
+            self._iterative_scan = self._supports_iterative_scan()
+            self.lexical = True                 # tsvector + GIN is part of the schema
 
-        def add(self, source: str, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None):
-            db = self.SessionLocal()
+        def _migrate_schema(self):
+            """create_all() never alters an existing table; add columns/indexes added later."""
+            with self.engine.begin() as conn:
+                conn.execute(sql_text("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+                conn.execute(sql_text("CREATE INDEX IF NOT EXISTS ix_chunks_content_hash ON chunks (content_hash)"))
+                conn.execute(sql_text("CREATE INDEX IF NOT EXISTS ix_chunks_source ON chunks (source)"))
+                conn.execute(sql_text(
+                    "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS text_tsv tsvector GENERATED ALWAYS AS "
+                    f"(to_tsvector('{settings.LEXICAL_TS_CONFIG}'::regconfig, text)) STORED"
+                ))
+                conn.execute(sql_text("CREATE INDEX IF NOT EXISTS ix_chunks_text_tsv ON chunks USING gin (text_tsv)"))
+                # ingest time for filters; rows stored before this column existed stay NULL
+                conn.execute(sql_text("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ"))
+                conn.execute(sql_text("ALTER TABLE chunks ALTER COLUMN created_at SET DEFAULT now()"))
+                conn.execute(sql_text("CREATE INDEX IF NOT EXISTS ix_chunks_created_at ON chunks (created_at)"))
+                # metadata filters are JSONB containment, served by one GIN index over every key
+                conn.execute(sql_text(
+                    "CREATE INDEX IF NOT EXISTS ix_chunks_meta_gin ON chunks USING gin ((meta::jsonb) jsonb_path_ops)"
+                ))
+
+        def _supports_iterative_scan(self) -> bool:
+            """pgvector >= 0.8 keeps scanning the ANN index until a filtered query has enough rows."""
+            with self.engine.connect() as conn:
+                version = conn.execute(
+                    sql_text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+                ).scalar()
             try:
-                objs = []
-                for i, (t, e) in enumerate(zip(texts, embeddings)):
-                    m = metadatas[i] if metadatas and i < len(metadatas) else {}
-                    obj = ChunkRow(source=source, text=t, metadata=json.dumps(m), embedding=e)
-                    db.add(obj)
-                    objs.append(obj)
-                db.commit()
-                for o in objs:
-                    db.refresh(o)
-                return objs
-            finally:
-                db.close()
+                return tuple(int(p) for p in (version or "0").split(".")[:2]) >= (0, 8)
+            except ValueError:
+                return False
+
+        @staticmethod
+        def _filter_clauses(filters: Optional[SearchFilter]) -> list:
+            if filters is None or filters.is_empty():
+                return []
+            clauses = []
+            sources = filters.sources()
+            if sources is not None:
+                clauses.append(ChunkRow.source.in_(sources))
+            meta = cast(ChunkRow.meta, JSONB)
+            exact = {k: v for k, v in filters.metadata.items() if not isinstance(v, list)}
+            if exact:
+                clauses.append(meta.op("@>")(cast(exact, JSONB)))
+            for key, values in filters.metadata.items():
+                if isinstance(values, list):
+                    # an empty list matches nothing (or_() with no arguments would drop the condition)
+                    clauses.append(or_(*(meta.op("@>")(cast({key: v}, JSONB)) for v in values)) if values else false())
+            if filters.ingested_after is not None:
+                clauses.append(ChunkRow.created_at >= as_utc(filters.ingested_after))
+            if filters.ingested_before is not None:
+                clauses.append(ChunkRow.created_at < as_utc(filters.ingested_before))
+            return clauses
+
+        def _create_ann_index(self):
+            """Create the HNSW / IVFFlat index on chunks.embedding (cosine ops) if configured."""
+            if self.ann_index == "hnsw":
+                ddl = "CREATE INDEX IF NOT EXISTS chunks_embedding_hnsw_idx ON chunks USING hnsw (embedding vector_cosine_ops)"
+            elif self.ann_index in ("ivf", "ivfflat"):
+                lists = settings.ANN_NLIST or 100
+                ddl = (
+                    "CREATE INDEX IF NOT EXISTS chunks_embedding_ivfflat_idx ON chunks "
+                    f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(lists)})"
+                )
+            else:
+                return
+            with self.engine.begin() as conn:
+                conn.execute(sql_text(ddl))
+
+        def add(self, source: str, texts: List[str], embeddings: List[List[float]],
+                metadatas: Optional[List[dict]] = None, batch_size: Optional[int] = None,
+                hashes: Optional[List[str]] = None) -> List[int]:
+            """
+            Bulk insert: one multi-row INSERT ... RETURNING id per batch, in one transaction.
+            Returns the new row ids in input order.
+            """
+            batch_size = batch_size or settings.INSERT_BATCH_SIZE
+            rows = [
+                {
+                    "source": source,
+                    "text": t,
+                    "meta": json.dumps(metadatas[i] if metadatas and i < len(metadatas) else {}),
+                    "embedding": e,
+                    "content_hash": hashes[i] if hashes else None,
+                }
+                for i, (t, e) in enumerate(zip(texts, embeddings))
+            ]
+            ids: List[int] = []
+            with self.engine.begin() as conn:
+                for i in range(0, len(rows), batch_size):
+                    batch = rows[i:i + batch_size]
+                    # "insertmanyvalues" renders the batch as a single VALUES list and
+                    # returns ids in parameter order.
+                    stmt = insert(ChunkRow).returning(ChunkRow.id, sort_by_parameter_order=True)
+                    ids.extend(conn.execute(stmt, batch).scalars().all())
+            return ids
+
+        def source_hashes(self, source: str) -> Dict[Optional[str], List[int]]:
+            """content_hash -> row ids for every chunk stored under `source`."""
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(ChunkRow.id, ChunkRow.content_hash).where(ChunkRow.source == source)
+                ).all()
+            out: Dict[Optional[str], List[int]] = {}
+            for row_id, h in rows:
+                out.setdefault(h, []).append(row_id)
+            return out
 
-        def search(self, query_embedding: List[float], top_k: int = 5) -> List[Tuple[dict, float]]:
-            # Use pgvector distance operator "<->" (small distance is better)
+        def embeddings_for_hashes(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+            """Stored embedding for each already-known content hash (any source)."""
+            hashes = list(hashes)
+            out: Dict[str, List[float]] = {}
+            with self.engine.connect() as conn:
+                for i in range(0, len(hashes), settings.INSERT_BATCH_SIZE):
+                    batch = hashes[i:i + settings.INSERT_BATCH_SIZE]
+                    stmt = (
+                        select(ChunkRow.content_hash, ChunkRow.embedding)
+                        .where(ChunkRow.content_hash.in_(batch))
+                        .distinct(ChunkRow.content_hash)
+                    )
+                    for h, e in conn.execute(stmt):
+                        out[h] = e
+            return out
+
+        def embeddings_for_ids(self, ids: Iterable[int]) -> Dict[int, List[float]]:
+            """Stored embedding of each chunk id."""
+            ids = list(ids)
+            out: Dict[int, List[float]] = {}
+            with self.engine.connect() as conn:
+                for i in range(0, len(ids), settings.INSERT_BATCH_SIZE):
+                    batch = ids[i:i + settings.INSERT_BATCH_SIZE]
+                    for row_id, e in conn.execute(select(ChunkRow.id, ChunkRow.embedding).where(ChunkRow.id.in_(batch))):
+                        out[row_id] = e
+            return out
+
+        def update_metadata(self, ids: List[int], metadata: dict) -> int:
+            """Set `metadata` on every chunk in `ids` (rows already carrying it are not rewritten)."""
+            meta = json.dumps(metadata)
+            updated = 0
+            with self.engine.begin() as conn:
+                for i in range(0, len(ids), settings.INSERT_BATCH_SIZE):
+                    stmt = (
+                        update(ChunkRow)
+                        .where(ChunkRow.id.in_(ids[i:i + settings.INSERT_BATCH_SIZE]), ChunkRow.meta.is_distinct_from(meta))
+                        .values(meta=meta)
+                    )
+                    updated += conn.execute(stmt).rowcount
+            return updated
+
+        def delete_ids(self, ids: List[int]) -> int:
+            if not ids:
+                return 0
+            with self.engine.begin() as conn:
+                for i in range(0, len(ids), settings.INSERT_BATCH_SIZE):
+                    conn.execute(delete(ChunkRow).where(ChunkRow.id.in_(ids[i:i + settings.INSERT_BATCH_SIZE])))
+            return len(ids)
+
+        def search(self, query_embedding: List[float], top_k: int = 5,
+                   probes: Optional[int] = None, ef_search: Optional[int] = None,
+                   query_text: Optional[str] = None, mode: Optional[str] = None,
+                   candidates: Optional[int] = None, filters: Optional[SearchFilter] = None) -> List[Tuple[dict, float]]:
+            """
+            mode "vector": cosine similarity. "lexical": ts_rank_cd over the GIN-indexed tsvector.
+            "hybrid": the top `candidates` of each, fused by reciprocal rank in the same query.
+            filters: pushed into the WHERE clause of every ranker.
+            """
+            mode = search_mode(mode, query_text)
+            where = self._filter_clauses(filters)
+            # Use pgvector cosine distance operator "<=>" (small distance is better), which
+            # matches the vector_cosine_ops index so the planner can use it.
             db = self.SessionLocal()
             try:
-                # SQLAlchemy text approach for vector distance
-                stmt = select(ChunkRow).order_by(ChunkRow.embedding.distance(query_embedding)).limit(top_k)
-                res = db.execute(stmt).scalars().all()
+                self._set_recall_knobs(db, top_k, probes, ef_search, bool(where))
+                distance = ChunkRow.embedding.cosine_distance(query_embedding)
+                if mode == "vector":
+                    stmt = select(ChunkRow, (1.0 - distance).label("score")).where(*where).order_by(distance).limit(top_k)
+                else:
+                    tsquery = func.to_tsquery(
+                        cast(settings.LEXICAL_TS_CONFIG, REGCONFIG), " | ".join(lexical_terms(query_text))
+                    )
+                    rank = func.ts_rank_cd(ChunkRow.text_tsv, tsquery)
+                    matches = ChunkRow.text_tsv.op("@@")(tsquery)
+                    if mode == "lexical":
+                        stmt = select(ChunkRow, rank.label("score")).where(matches, *where).order_by(rank.desc()).limit(top_k)
+                    else:
+                        stmt = self._hybrid_stmt(distance, rank, matches, top_k, candidates, where)
+                res = db.execute(stmt).all()
                 out = []
-                for r in res:
-                    # Convert distance to similarity-like score using reciprocal
-                    # Note: pgvector distance is Euclidean by default; for ranking it's fine.
+                for r, score in res:
                     out.append(({
                         "id": r.id,
                         "source": r.source,
                         "text": r.text,
-                        "metadata": json.loads(r.metadata) if r.metadata else {},
-                    }, 1.0))  # we don't have direct distance here; ranking is order-based
+                        "metadata": json.loads(r.meta) if r.meta else {},
+                    }, float(score)))  # cosine similarity / lexical rank / fused rank
+                # relaxed-order iterative scans may return rows slightly out of order
+                out.sort(key=lambda item: -item[1])
                 return out
             finally:
                 db.close()
 
+        def _set_recall_knobs(self, db, top_k: int, probes: Optional[int], ef_search: Optional[int], filtered: bool):
+            # recall knobs only apply to the current transaction
+            if self.ann_index == "hnsw":
+                ef = max(int(ef_search or settings.ANN_EF_SEARCH), top_k)
+                db.execute(sql_text(f"SET LOCAL hnsw.ef_search = {ef}"))
+            elif self.ann_index in ("ivf", "ivfflat"):
+                db.execute(sql_text(f"SET LOCAL ivfflat.probes = {int(probes or settings.ANN_PROBES)}"))
+            if filtered and self._iterative_scan and self.ann_index != "none":
+                # without this a selective filter can leave fewer than top_k rows after the index scan
+                if self.ann_index == "hnsw":
+                    db.execute(sql_text("SET LOCAL hnsw.iterative_scan = strict_order"))
+                else:
+                    db.execute(sql_text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+
+        def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                         probes: Optional[int] = None, ef_search: Optional[int] = None,
+                         filters: Optional[SearchFilter] = None) -> List[List[Tuple[dict, float]]]:
+            """
+            Vector search for many queries in one round trip per BATCH_QUERY_BLOCK queries: a
+            UNION ALL of per-query, index-ordered top_k subqueries tagged with the query's position.
+            """
+            out: List[List[Tuple[dict, float]]] = [[] for _ in query_embeddings]
+            if top_k <= 0:
+                return out
+            where = self._filter_clauses(filters)
+            db = self.SessionLocal()
+            try:
+                self._set_recall_knobs(db, top_k, probes, ef_search, bool(where))
+                for start in range(0, len(query_embeddings), settings.BATCH_QUERY_BLOCK):
+                    parts = []
+                    for i, q in enumerate(query_embeddings[start:start + settings.BATCH_QUERY_BLOCK], start):
+                        distance = ChunkRow.embedding.cosine_distance(q)
+                        parts.append(
+                            select(literal(i).label("q"), ChunkRow.id.label("id"), (1.0 - distance).label("score"))
+                            .where(*where).order_by(distance).limit(top_k)
+                        )
+                    hits = union_all(*parts).subquery()
+                    rows = db.execute(
+                        select(hits.c.q, ChunkRow, hits.c.score).join(hits, ChunkRow.id == hits.c.id)
+                    ).all()
+                    for q, r, score in rows:
+                        out[int(q)].append(({
+                            "id": r.id,
+                            "source": r.source,
+                            "text": r.text,
+                            "metadata": json.loads(r.meta) if r.meta else {},
+                        }, float(score)))
+            finally:
+                db.close()
+            for results in out:
+                results.sort(key=lambda item: -item[1])
+            return out
+
+        @staticmethod
+        def _hybrid_stmt(distance, rank, matches, top_k: int, candidates: Optional[int], where: list):
+            n = max(top_k, candidates or settings.HYBRID_CANDIDATES)
+            by_vector = select(ChunkRow.id, distance.label("d")).where(*where).order_by(distance).limit(n).subquery()
+            by_text = select(ChunkRow.id, rank.label("s")).where(matches, *where).order_by(rank.desc()).limit(n).subquery()
+            ranked = union_all(
+                select(by_vector.c.id, func.row_number().over(order_by=by_vector.c.d).label("r")),
+                select(by_text.c.id, func.row_number().over(order_by=by_text.c.s.desc()).label("r")),
+            ).subquery()
+            fused = (
+                select(ranked.c.id, func.sum(1.0 / (settings.RRF_K + ranked.c.r)).label("score"))
+                .group_by(ranked.c.id)
+                .order_by(sql_text("score DESC"))
+                .limit(top_k)
+                .subquery()
+            )
+            return (
+                select(ChunkRow, fused.c.score)
+                .join(fused, ChunkRow.id == fused.c.id)
+                .order_by(fused.c.score.desc())
+            )
+
 # ---------- SQLITE fallback implementation ----------
 class SQLiteVectorStore:
-    def __init__(self, path: str):
+    """
+    Embeddings are stored as little-endian float32 BLOBs. On first search the whole
+    table is loaded once into a pre-normalized NumPy matrix, which is kept in sync on
+    add(), so a query is a single matrix-vector product plus an argpartition top-k.
+
+    With VECTOR_SEGMENTS on, that matrix is instead a read-only memory map of a
+    persistent segment file next to VECTOR_DB_PATH (see vector_segments.py): workers
+    start without decoding any BLOBs and share the rows through the page cache. Deleted
+    rows are tombstoned (masked out before every top-k) until background compaction drops them.
+
+    With ANN_INDEX enabled and at least ANN_MIN_ROWS rows, queries go through an IVF
+    index (see ann_index.py) persisted at "<VECTOR_DB_PATH>.ivf.npz".
+
+    Chunk text is also indexed by an FTS5 external-content table (chunks_fts), kept in
+    sync by triggers, for BM25 lexical and hybrid search.
+
+    Filtered searches select the matching ids in SQL (source / created_at / metadata
+    expression indexes) and score only those rows.
+
+    With SEARCH_SHARDS > 1, exact scans of at least SEARCH_SHARD_MIN_ROWS rows are split
+    by id range across a pool of worker processes that memory-map a snapshot of the
+    matrix (see sharded_search.py). Rows added after the snapshot are scanned in-process
+    until there are more than SEARCH_SHARD_MAX_TAIL of them, then it is republished.
+    """
+
+    def __init__(self, path: str, ann_index: str = None):
         self.path = path
-        init = not os.path.exists(self.path)
+        self.index_path = f"{path}.ivf.npz"
         self.conn = sqlite3.connect(self.path, check_same_thread=False)
-        if init:
-            self._create_tables()
+        self._lock = threading.RLock()
+        self._ids: Optional[np.ndarray] = None      # (n,) int64 row ids
+        self._matrix: Optional[np.ndarray] = None   # (n, dim) float32, L2-normalized rows
+        self._use_ann = (ann_index or settings.ANN_INDEX).lower() != "none"
+        self._ann: Optional[IVFIndex] = None
+        self._ann_dirty = False                     # extended since it was last persisted
+        self._ann_saved_at = 0.0                    # monotonic time of the last persist
+        self._seg_view = None                       # VectorSegments view _ids/_matrix come from
+        self._fts = False
+        self._segments = (
+            VectorSegments(f"{path}.segments", settings.VECTOR_COMPACT_RATIO) if settings.VECTOR_SEGMENTS else None
+        )
+        self._sharded = ShardedSearcher(f"{path}.shards", settings.SEARCH_SHARDS) if settings.SEARCH_SHARDS > 1 else None
+        self._create_tables()
+        self._migrate_json_embeddings()
+        atexit.register(self.flush)
+
+    @property
+    def lexical(self) -> bool:
+        """Whether lexical/hybrid search is available (SQLite built with FTS5)."""
+        return self._fts
 
     def _create_tables(self):
         cur = self.conn.cursor()
@@ -101,54 +438,543 @@ class SQLiteVectorStore:
             source TEXT,
             text TEXT NOT NULL,
             metadata TEXT,
-            embedding TEXT NOT NULL
+            embedding BLOB NOT NULL,
+            content_hash TEXT,
+            created_at REAL
         );
         """)
+        columns = {r[1] for r in cur.execute("PRAGMA table_info(chunks)").fetchall()}
+        if "content_hash" not in columns:
+            cur.execute("ALTER TABLE chunks ADD COLUMN content_hash TEXT")
+        if "created_at" not in columns:
+            # unix time of ingest; rows stored before this column existed stay NULL
+            cur.execute("ALTER TABLE chunks ADD COLUMN created_at REAL")
+        cur.execute("CREATE INDEX IF NOT EXISTS chunks_content_hash_idx ON chunks (content_hash)")
+        cur.execute("CREATE INDEX IF NOT EXISTS chunks_source_idx ON chunks (source)")
+        cur.execute("CREATE INDEX IF NOT EXISTS chunks_created_at_idx ON chunks (created_at)")
+        for key in filter(None, (k.strip() for k in settings.FILTER_INDEXED_KEYS.split(","))):
+            name = re.sub(r"\W", "_", key)
+            cur.execute(f"CREATE INDEX IF NOT EXISTS chunks_meta_{name}_idx ON chunks ({sqlite_metadata_expr(key)})")
+        self._fts = self._create_fts(cur)
         self.conn.commit()
 
-    def _encode(self, v: List[float]) -> str:
-        # store as JSON string
-        return json.dumps(v)
-
-    def _decode(self, s: str) -> List[float]:
-        return json.loads(s)
+    def _create_fts(self, cur) -> bool:
+        existed = cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone() is not None
+        try:
+            # '_' is a token character so snake_case identifiers and error codes match whole
+            cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='id', tokenize="unicode61 tokenchars '_'"
+            );
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite FTS5 unavailable, lexical/hybrid search falls back to vector: {e}")
+            return False
+        cur.executescript("""
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE OF text ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+        """)
+        if not existed:
+            # index rows stored before the FTS table existed
+            cur.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+        return True
 
-    def add(self, source: str, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None):
+    def _migrate_json_embeddings(self, batch_size: int = 1000):
+        """Rewrite legacy JSON text embeddings as float32 BLOBs, in place."""
         cur = self.conn.cursor()
-        for i, (t, e) in enumerate(zip(texts, embeddings)):
-            m = metadatas[i] if metadatas and i < len(metadatas) else {}
+        while True:
             cur.execute(
-                "INSERT INTO chunks (source, text, metadata, embedding) VALUES (?, ?, ?, ?)",
-                (source, t, json.dumps(m), self._encode(e))
+                "SELECT id, embedding FROM chunks WHERE typeof(embedding) = 'text' LIMIT ?",
+                (batch_size,)
             )
-        self.conn.commit()
+            rows = cur.fetchall()
+            if not rows:
+                break
+            cur.executemany(
+                "UPDATE chunks SET embedding = ? WHERE id = ?",
+                [(self._encode(json.loads(e)), i) for i, e in rows]
+            )
+            self.conn.commit()
+
+    def _encode(self, v: List[float]) -> bytes:
+        # store as raw float32 bytes (4 bytes per dimension)
+        return np.asarray(v, dtype="<f4").tobytes()
+
+    def _decode(self, b: bytes) -> np.ndarray:
+        return np.frombuffer(b, dtype="<f4")
 
-    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Tuple[dict, float]]:
+    @staticmethod
+    def _normalize(m: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(m, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (m / norms).astype(np.float32, copy=False)
+
+    def _load_matrix(self):
+        if self._segments is not None:
+            self._sync_segments()
+            self._use_segments()
+            return
         cur = self.conn.cursor()
-        cur.execute("SELECT id, source, text, metadata, embedding FROM chunks")
+        cur.execute("SELECT id, embedding FROM chunks ORDER BY id")
         rows = cur.fetchall()
-        scored = []
-        for r in rows:
-            emb = self._decode(r[4])
-            score = self._cosine_similarity(query_embedding, emb)
-            scored.append(({
-                "id": r[0],
-                "source": r[1],
-                "text": r[2],
-                "metadata": json.loads(r[3]) if r[3] else {},
-            }, score))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return scored[:top_k]
-
-    def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
-        if not a or not b:
-            return 0.0
-        dot = sum(x*y for x,y in zip(a,b))
-        na = math.sqrt(sum(x*x for x in a))
-        nb = math.sqrt(sum(x*x for x in b))
-        if na == 0 or nb == 0:
-            return 0.0
-        return dot / (na*nb)
+        if not rows:
+            self._ids = np.empty(0, dtype=np.int64)
+            self._matrix = None
+            return
+        self._ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        self._matrix = self._normalize(np.vstack([self._decode(r[1]) for r in rows]))
+        self._sync_ann()
+
+    def _sync_segments(self, batch_size: int = 1000):
+        """Copy rows not yet in the segment file (added by any worker) into it."""
+        segments = self._segments
+        segments.refresh()
+        # AUTOINCREMENT ids never go back: a lower high-water mark means the database was replaced
+        seq = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'chunks'").fetchone()
+        if segments.manifest["last_id"] > (seq[0] if seq else 0):
+            segments.reset()
+
+        def read_after(last_id: int):
+            rows = self.conn.execute(
+                "SELECT id, embedding FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return None
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            return ids, self._normalize(np.vstack([self._decode(r[1]) for r in rows]))
+
+        segments.sync(read_after)
+
+    def _use_segments(self):
+        # one view: ids, matrix and tombstones of the same generation even mid-compaction
+        view = self._seg_view = self._segments.view
+        self._ids, self._matrix = view.ids, view.matrix
+        self._sync_ann()
+
+    def _sync_ann(self):
+        """Load, extend or (re)build the IVF index so it covers the whole matrix."""
+        if not self._use_ann or self._matrix is None or len(self._ids) < settings.ANN_MIN_ROWS:
+            return
+        last_id = int(self._ids[-1])
+        if self._ann is None:
+            self._ann = IVFIndex.load(self.index_path)
+        ann = self._ann
+        if ann is not None:
+            # a persisted index is reusable if it covers a prefix of the current rows
+            valid = (
+                ann.n_rows <= len(self._ids)
+                and ann.centroids.shape[1] == self._matrix.shape[1]
+                and (ann.n_rows == 0 or int(self._ids[ann.n_rows - 1]) == ann.last_id)
+            )
+            if not valid:
+                ann = None
+        if ann is None:
+            self._ann = IVFIndex.build(self._matrix, last_id, nlist=settings.ANN_NLIST)
+            # a rebuild is worth keeping right away; incremental adds are persisted on a timer
+            self._save_ann()
+            return
+        if ann.n_rows == len(self._ids):
+            return
+        ann.add(self._matrix, last_id)
+        self._ann_dirty = True
+        if time.monotonic() - self._ann_saved_at >= settings.ANN_SAVE_INTERVAL:
+            self._save_ann()
+
+    def _save_ann(self):
+        self._ann_dirty = False
+        self._ann_saved_at = time.monotonic()
+        try:
+            self._ann.save(self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist ANN index to {self.index_path}: {e}")
+
+    def flush(self):
+        """Persist the IVF index if rows were added to it since the last save (also run at exit)."""
+        with self._lock:
+            if self._ann is not None and self._ann_dirty:
+                self._save_ann()
+
+    def vector_view(self) -> Tuple[Optional[np.ndarray], np.ndarray, Optional[IVFIndex]]:
+        """The L2-normalized matrix (None when empty), its row ids and the IVF index searches use."""
+        matrix, ids, ann, _, _ = self._view(None)
+        return matrix, ids, ann
+
+    def _append_to_matrix(self, ids: List[int], embeddings: List[List[float]]):
+        if self._segments is not None:
+            # keep the segment file current even before this worker searches, so others start warm
+            self._sync_segments()
+            if self._ids is not None:
+                self._use_segments()
+            return
+        # Only maintain the matrix once it has been loaded; otherwise the first
+        # search will pick the new rows up from the table.
+        if self._ids is None or not ids:
+            return
+        block = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        self._ids = np.concatenate([self._ids, np.asarray(ids, dtype=np.int64)])
+        self._matrix = block if self._matrix is None else np.vstack([self._matrix, block])
+        self._sync_ann()
+
+    def add(self, source: str, texts: List[str], embeddings: List[List[float]],
+            metadatas: Optional[List[dict]] = None, batch_size: Optional[int] = None,
+            hashes: Optional[List[str]] = None) -> List[int]:
+        """
+        Batched insert: one executemany per batch inside a single write transaction.
+        Returns the new row ids in input order.
+        """
+        batch_size = batch_size or settings.INSERT_BATCH_SIZE
+        now = time.time()
+        rows = [
+            (
+                source,
+                t,
+                json.dumps(metadatas[i] if metadatas and i < len(metadatas) else {}),
+                self._encode(e),
+                hashes[i] if hashes else None,
+                now,
+            )
+            for i, (t, e) in enumerate(zip(texts, embeddings))
+        ]
+        if not rows:
+            return []
+        with self._lock:
+            cur = self.conn.cursor()
+            try:
+                # take the write lock up front so no other writer can interleave ids
+                cur.execute("BEGIN IMMEDIATE")
+                cur.execute("SELECT COALESCE(MAX(id), 0) FROM chunks")
+                before = cur.fetchone()[0]
+                for i in range(0, len(rows), batch_size):
+                    cur.executemany(
+                        "INSERT INTO chunks (source, text, metadata, embedding, content_hash, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        rows[i:i + batch_size]
+                    )
+                cur.execute("SELECT id FROM chunks WHERE id > ? ORDER BY id", (before,))
+                ids = [r[0] for r in cur.fetchall()]
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self._append_to_matrix(ids, embeddings[:len(ids)])
+        return ids
+
+    def source_hashes(self, source: str) -> Dict[Optional[str], List[int]]:
+        """content_hash -> row ids for every chunk stored under `source`."""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, content_hash FROM chunks WHERE source = ?", (source,)).fetchall()
+        out: Dict[Optional[str], List[int]] = {}
+        for row_id, h in rows:
+            out.setdefault(h, []).append(row_id)
+        return out
+
+    def embeddings_for_hashes(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Stored embedding for each already-known content hash (any source)."""
+        hashes = list(hashes)
+        out: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # stay well under SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT content_hash, embedding FROM chunks WHERE content_hash IN ({placeholders})", batch
+                ).fetchall()
+                for h, e in rows:
+                    out.setdefault(h, self._decode(e))
+        return out
+
+    def embeddings_for_ids(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Stored embedding of each chunk id."""
+        ids = list(ids)
+        out: Dict[int, np.ndarray] = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT id, embedding FROM chunks WHERE id IN ({placeholders})", batch).fetchall()
+                for row_id, e in rows:
+                    out[row_id] = self._decode(e)
+        return out
+
+    def update_metadata(self, ids: List[int], metadata: dict) -> int:
+        """Set `metadata` on every chunk in `ids` (rows already carrying it are not rewritten)."""
+        meta = json.dumps(metadata)
+        updated = 0
+        with self._lock:
+            try:
+                for i in range(0, len(ids), 500):
+                    batch = ids[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    updated += self.conn.execute(
+                        f"UPDATE chunks SET metadata = ? WHERE id IN ({placeholders}) AND metadata IS NOT ?",
+                        [meta, *batch, meta]
+                    ).rowcount
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return updated
+
+    def delete_ids(self, ids: List[int]) -> int:
+        if not ids:
+            return 0
+        with self._lock:
+            try:
+                for i in range(0, len(ids), 500):
+                    batch = ids[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    self.conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            if self._segments is not None:
+                # tombstones keep row positions (and the ANN index) valid until compaction
+                self._segments.delete(ids)
+                if self._ids is not None:
+                    self._use_segments()
+                self._segments.maybe_compact()
+                return len(ids)
+            if self._ids is not None and len(self._ids):
+                # drop the deleted rows in place; positions shift, so only the ANN index is rebuilt
+                keep = ~np.isin(self._ids, np.asarray(ids, dtype=np.int64))
+                if not keep.all():
+                    self._ids = self._ids[keep]
+                    self._matrix = self._matrix[keep] if len(self._ids) else None
+                    self._ann = None
+                    self._sync_ann()
+        return len(ids)
+
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               probes: Optional[int] = None, ef_search: Optional[int] = None,
+               query_text: Optional[str] = None, mode: Optional[str] = None,
+               candidates: Optional[int] = None, filters: Optional[SearchFilter] = None) -> List[Tuple[dict, float]]:
+        """
+        probes: IVF clusters to scan (defaults to settings.ANN_PROBES).
+        ef_search: HNSW-only knob, accepted for interface parity with PGVectorStore.
+        mode: "vector" (cosine), "lexical" (BM25 on query_text) or "hybrid" (the top
+        `candidates` of each fused by reciprocal rank). Defaults to settings.SEARCH_MODE.
+        filters: only chunks matching it are scored.
+        """
+        # callers resolve the mode the same way (VectorStore.search_mode) before deciding to embed
+        mode = search_mode(mode, query_text, self._fts)
+        if filters is not None and filters.is_empty():
+            filters = None
+        if top_k <= 0:
+            return []
+        if mode == "lexical":
+            ids, scores = self._lexical_top(query_text, top_k, filters)
+            return self._fetch_rows(ids, scores)
+
+        n = top_k if mode == "vector" else max(top_k, candidates or settings.HYBRID_CANDIDATES)
+        ids, scores = self._vector_top(query_embedding, n, probes, filters)
+        if mode == "hybrid":
+            lexical_ids, _ = self._lexical_top(query_text, n, filters)
+            fused = reciprocal_rank_fusion([ids, lexical_ids], settings.RRF_K, top_k)
+            ids, scores = [i for i, _ in fused], [score for _, score in fused]
+        return self._fetch_rows(ids, scores)
+
+    def _view(self, filters: Optional[SearchFilter]):
+        """Consistent (matrix, ids, ann, tombstoned positions, filtered positions) for one search."""
+        with self._lock:
+            if self._ids is None:
+                self._load_matrix()
+            elif self._segments is not None:
+                # pick up rows other workers appended, deleted or compacted away
+                self._segments.refresh()
+                if self._seg_view is not self._segments.view:
+                    self._use_segments()
+            matrix, ids, ann = self._matrix, self._ids, self._ann
+            dead = self._seg_view.dead if self._segments is not None else None
+            allowed = self._filter_positions(ids, filters) if filters is not None and matrix is not None else None
+        return matrix, ids, ann, dead, allowed
+
+    def _queries(self, query_embeddings, matrix: np.ndarray) -> np.ndarray:
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        if q.shape[-1] != matrix.shape[1]:
+            raise ValueError(f"Query dimension {q.shape[-1]} does not match stored dimension {matrix.shape[1]}")
+        return self._normalize(q)
+
+    def _vector_top(self, query_embedding: List[float], n: int, probes: Optional[int],
+                    filters: Optional[SearchFilter] = None) -> Tuple[List[int], List[float]]:
+        matrix, ids, ann, dead, allowed = self._view(filters)
+        if matrix is None:
+            return [], []
+        q = self._queries(query_embedding, matrix)
+
+        if allowed is not None:
+            # the SQL filter already excludes deleted rows
+            top, top_scores = self._filtered_top_k(matrix, ids, ann, q, n, probes, allowed)
+        elif ann is not None:
+            # tombstoned rows are still in the mapped matrix: masked out before the top-k
+            top, top_scores = ann.search(matrix, q, n, probes or settings.ANN_PROBES, exclude=dead)
+        else:
+            top, top_scores = self._scan(matrix, ids, q, n, exclude=dead)
+        return [int(ids[i]) for i in top], [float(s) for s in top_scores]
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                     probes: Optional[int] = None, ef_search: Optional[int] = None,
+                     filters: Optional[SearchFilter] = None) -> List[List[Tuple[dict, float]]]:
+        """
+        Vector search for many queries at once: each block of BATCH_QUERY_BLOCK queries is
+        scored by one matrix-matrix product (exact), or per query through the IVF index when
+        unfiltered; the rows for every query are then read in one SELECT.
+        """
+        if filters is not None and filters.is_empty():
+            filters = None
+        if top_k <= 0 or not query_embeddings:
+            return [[] for _ in query_embeddings]
+        matrix, ids, ann, dead, allowed = self._view(filters)
+        if matrix is None or (allowed is not None and len(allowed) == 0):
+            return [[] for _ in query_embeddings]
+        queries = self._queries(query_embeddings, matrix)
+
+        # the SQL filter already excludes deleted rows; otherwise tombstones are masked out
+        dead = dead if allowed is None and dead is not None and len(dead) else None
+        tops: List[Tuple[np.ndarray, np.ndarray]] = []
+        if ann is not None and allowed is None:
+            tops = [ann.search(matrix, q, top_k, probes or settings.ANN_PROBES, exclude=dead) for q in queries]
+        else:
+            rows = matrix if allowed is None else matrix[allowed]
+            k = min(top_k, rows.shape[0] - (len(dead) if dead is not None else 0))
+            if k <= 0:
+                return [[] for _ in query_embeddings]
+            for start in range(0, len(queries), settings.BATCH_QUERY_BLOCK):
+                scores = queries[start:start + settings.BATCH_QUERY_BLOCK] @ rows.T
+                if dead is not None:
+                    scores[:, dead] = -np.inf
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                tops.extend((t if allowed is None else allowed[t], ts) for t, ts in zip(top, top_scores))
+
+        ranked = [(ids[top].tolist(), top_scores.tolist()) for top, top_scores in tops]
+        docs = self._fetch_docs({i for top_ids, _ in ranked for i in top_ids})
+        return [
+            [(docs[i], s) for i, s in zip(top_ids, top_scores) if i in docs]
+            for top_ids, top_scores in ranked
+        ]
+
+    def _filter_positions(self, ids: np.ndarray, filters: SearchFilter) -> np.ndarray:
+        """Matrix positions of the rows matching `filters` (selected in SQL, through the indexes)."""
+        where, params = sqlite_where(filters)
+        rows = self.conn.execute(f"SELECT id FROM chunks WHERE {where}", params).fetchall()
+        wanted = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        # rows not (yet) in the matrix snapshot are dropped; positions come back ascending
+        return np.intersect1d(ids, wanted, assume_unique=True, return_indices=True)[1]
+
+    def _filtered_top_k(self, matrix: np.ndarray, ids: np.ndarray, ann: Optional[IVFIndex], q: np.ndarray,
+                        n: int, probes: Optional[int], allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if len(allowed) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if ann is not None and len(allowed) >= settings.ANN_MIN_ROWS:
+            # broad filter: over-fetch from the ANN index by the filter's selectivity, keep matches
+            fetch = min(len(matrix), int(np.ceil(n * len(matrix) / len(allowed))) * 2)
+            top, top_scores = ann.search(matrix, q, fetch, probes or settings.ANN_PROBES)
+            keep = np.isin(top, allowed)
+            if keep.sum() >= n:
+                return top[keep][:n], top_scores[keep][:n]
+        # narrow filter (or too few ANN hits): exact scan of the matching rows only
+        return self._scan(matrix, ids, q, n, allowed)
+
+    def _scan(self, matrix: np.ndarray, ids: np.ndarray, q: np.ndarray, n: int,
+              allowed: Optional[np.ndarray] = None, exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-n positions over the matrix except `exclude` (ascending positions), or
+        over its `allowed` (ascending) positions.
+        """
+        size = len(matrix) if allowed is None else len(allowed)
+        if self._sharded is not None and size >= settings.SEARCH_SHARD_MIN_ROWS:
+            try:
+                return self._sharded_scan(matrix, ids, q, n, allowed, exclude)
+            except Exception as e:
+                logger.warning(f"Sharded search failed, scanning in-process: {e}")
+        if allowed is None:
+            return self._exact_top_k(matrix, q, n, exclude)
+        sub, sub_scores = self._exact_top_k(matrix[allowed], q, n)
+        return allowed[sub], sub_scores
+
+    def _sharded_scan(self, matrix: np.ndarray, ids: np.ndarray, q: np.ndarray, n: int,
+                      allowed: Optional[np.ndarray], exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            covered = self._sharded.covered_rows(ids, matrix)
+            # a memory-mapped segment is republished for free, so it never leaves a tail
+            max_tail = 0 if isinstance(matrix, np.memmap) else settings.SEARCH_SHARD_MAX_TAIL
+            if covered == 0 or len(ids) - covered > max_tail:
+                self._sharded.publish(matrix, int(ids[-1]))
+                covered = len(ids)
+            snapshot = self._sharded.snapshot
+        head = None if allowed is None else allowed[:int(np.searchsorted(allowed, covered))]
+        if exclude is not None and allowed is None:
+            cut = int(np.searchsorted(exclude, covered))
+            head_exclude, tail_exclude = exclude[:cut], exclude[cut:] - covered
+        else:
+            head_exclude = tail_exclude = None
+        top, top_scores = self._sharded.search(snapshot, covered, q, n, head, head_exclude)
+        # rows added since the snapshot was published
+        tail = np.arange(covered, len(ids)) if allowed is None else allowed[len(head):]
+        if len(tail) == 0:
+            return top, top_scores
+        sub, sub_scores = self._exact_top_k(matrix[tail], q, n, tail_exclude)
+        positions = np.concatenate([top, tail[sub]])
+        best, best_scores = top_k_of(np.concatenate([top_scores, sub_scores]), n)
+        return positions[best], best_scores
+
+    def _lexical_top(self, query_text: str, n: int,
+                     filters: Optional[SearchFilter] = None) -> Tuple[List[int], List[float]]:
+        """Row ids by BM25 (any query term may match), with positive scores (higher is better)."""
+        match = " OR ".join(f'"{t}"' for t in lexical_terms(query_text))
+        where, params = sqlite_where(filters)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT chunks_fts.rowid, bm25(chunks_fts) FROM chunks_fts "
+                "JOIN chunks ON chunks.id = chunks_fts.rowid "
+                f"WHERE chunks_fts MATCH ? AND {where} "
+                "ORDER BY bm25(chunks_fts) LIMIT ?",
+                (match, *params, n)
+            ).fetchall()
+        # FTS5's bm25() is negated so that ascending order is best-first
+        return [r[0] for r in rows], [-r[1] for r in rows]
+
+    @staticmethod
+    def _exact_top_k(matrix: np.ndarray, q: np.ndarray, top_k: int,
+                     exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        return top_k_of(matrix @ q, top_k, exclude)
+
+    def _fetch_rows(self, ids: List[int], scores: List[float]) -> List[Tuple[dict, float]]:
+        docs = self._fetch_docs(ids)
+        return [(docs[i], score) for i, score in zip(ids, scores) if i in docs]
+
+    def _fetch_docs(self, ids: Iterable[int]) -> Dict[int, dict]:
+        ids = list(ids)
+        docs: Dict[int, dict] = {}
+        with self._lock:
+            # stay well under SQLite's bound-parameter limit
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT id, source, text, metadata FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                for r in rows:
+                    docs[r[0]] = {
+                        "id": r[0],
+                        "source": r[1],
+                        "text": r[2],
+                        "metadata": json.loads(r[3]) if r[3] else {},
+                    }
+        return docs
 
 # ---------- Factory ----------
 class VectorStore:
@@ -169,3 +995,25 @@ class VectorStore:
 
     def search(self, *args, **kwargs):
         return self._impl.search(*args, **kwargs)
+
+    def search_batch(self, *args, **kwargs):
+        return self._impl.search_batch(*args, **kwargs)
+
+    def search_mode(self, mode: Optional[str], query_text: Optional[str]) -> str:
+        """Resolve `mode` for this backend: lexical/hybrid become vector when it has no lexical index."""
+        return search_mode(mode, query_text, self._impl.lexical)
+
+    def source_hashes(self, *args, **kwargs):
+        return self._impl.source_hashes(*args, **kwargs)
+
+    def embeddings_for_hashes(self, *args, **kwargs):
+        return self._impl.embeddings_for_hashes(*args, **kwargs)
+
+    def embeddings_for_ids(self, *args, **kwargs):
+        return self._impl.embeddings_for_ids(*args, **kwargs)
+
+    def update_metadata(self, *args, **kwargs):
+        return self._impl.update_metadata(*args, **kwargs)
+
+    def delete_ids(self, *args, **kwargs):
+        return self._impl.delete_ids(*args, **kwargs)
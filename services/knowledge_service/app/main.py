@@ -1,9 +1,20 @@
 # knowledge_service/app/main.py
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.routes import router as api_router
+from app.core.http_clients import init_clients, close_clients
 
-app = FastAPI(title="CortexOS Knowledge Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one pooled HTTP client per downstream service for the app's lifetime
+    await init_clients()
+    yield
+    await close_clients()
+
+
+app = FastAPI(title="CortexOS Knowledge Service", lifespan=lifespan)
 
 # Mount all routes
 app.include_router(api_router, prefix="/api")
@@ -0,0 +1,74 @@
+# services/knowledge_service/scripts/bench_ann.py
+"""
+Recall-vs-latency benchmark: IVF index vs exact scan on the SQLite vector store.
+
+Usage (from services/knowledge_service):
+    EMBEDDING_SERVICE_URL=http://unused python -m scripts.bench_ann --rows 50000 --dim 384
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.core.ann_index import IVFIndex
+from app.core.sharded_search import top_k
+from app.core.vector_store import SQLiteVectorStore
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Synthetic corpus with topical structure, closer to real embeddings than pure noise."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=n)
+    return centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus = clustered_vectors(args.rows, args.dim, 64, rng)
+    queries = clustered_vectors(args.queries, args.dim, 64, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        store = SQLiteVectorStore(path, ann_index="ivf")
+        batch = 5000
+        for i in range(0, args.rows, batch):
+            part = corpus[i:i + batch]
+            store.add("bench", [f"chunk {i + j}" for j in range(len(part))], part.tolist())
+
+        # exact ground truth straight from the store's normalized matrix
+        matrix, ids, ann = store.vector_view()
+        if ann is None:
+            raise SystemExit("ANN index was not built; raise --rows above ANN_MIN_ROWS")
+        if args.nlist:
+            ann = IVFIndex.build(matrix, int(ids[-1]), nlist=args.nlist)
+        qn = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+        start = time.perf_counter()
+        truth = [set(top_k(matrix @ q, args.top_k)[0].tolist()) for q in qn]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(qn)
+
+        print(f"rows={args.rows} dim={args.dim} nlist={ann.nlist} top_k={args.top_k}")
+        print(f"{'mode':<12}{'recall':>8}{'ms/query':>12}")
+        print(f"{'exact':<12}{1.0:>8.3f}{exact_ms:>12.3f}")
+        for probes in args.probes:
+            start = time.perf_counter()
+            found = [ann.search(matrix, q, args.top_k, probes)[0] for q in qn]
+            ms = (time.perf_counter() - start) * 1000 / len(qn)
+            recall = np.mean([len(truth[i] & set(f.tolist())) / args.top_k for i, f in enumerate(found)])
+            print(f"{'probes=' + str(probes):<12}{recall:>8.3f}{ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+# services/knowledge_service/tests/test_search_filter.py
+import os
+
+os.environ.setdefault("EMBEDDING_SERVICE_URL", "http://unused")
+os.environ.setdefault("DATABASE_URL", "sqlite:///unused")
+
+import pytest
+
+from app.core import vector_store
+from app.core.search_filter import SearchFilter
+from app.core.vector_store import SQLiteVectorStore
+
+EMPTY_LIST = SearchFilter(metadata={"tenant": []})
+
+
+def test_sqlite_empty_metadata_list_matches_nothing(tmp_path):
+    store = SQLiteVectorStore(str(tmp_path / "v.db"), ann_index="none")
+    store.add("a", ["alpha"], [[1.0, 0.0]], [{"tenant": "t1"}])
+
+    assert store.search([1.0, 0.0], top_k=5, mode="vector", filters=EMPTY_LIST) == []
+    assert store.search([1.0, 0.0], top_k=5, mode="vector", filters=SearchFilter(metadata={"tenant": ["t1"]}))
+
+
+@pytest.mark.skipif(not vector_store.USE_PGVECTOR, reason="sqlalchemy/pgvector not installed")
+def test_pg_empty_metadata_list_matches_nothing():
+    from sqlalchemy import select
+    from sqlalchemy.dialects import postgresql
+
+    clauses = vector_store.PGVectorStore._filter_clauses(EMPTY_LIST)
+    sql = str(select(vector_store.ChunkRow.id).where(*clauses).compile(dialect=postgresql.dialect()))
+
+    assert "WHERE false" in sql
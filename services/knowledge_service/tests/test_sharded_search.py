@@ -0,0 +1,31 @@
+# services/knowledge_service/tests/test_sharded_search.py
+import os
+
+os.environ.setdefault("EMBEDDING_SERVICE_URL", "http://unused")
+os.environ.setdefault("DATABASE_URL", "sqlite:///unused")
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.sharded_search import ShardedSearcher
+from app.core.vector_store import SQLiteVectorStore
+
+
+def test_sharded_search_finds_rows_appended_after_a_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_SHARD_MIN_ROWS", 1)
+    store = SQLiteVectorStore(str(tmp_path / "v.db"), ann_index="none")
+    store._sharded = ShardedSearcher(str(tmp_path / "v.db.shards"), 2)
+    try:
+        rng = np.random.default_rng(0)
+        corpus = rng.standard_normal((20, 16)).astype(np.float32)
+        store.add("a", [f"t{i}" for i in range(20)], corpus.tolist())
+        store.search(corpus[0].tolist(), top_k=1)
+
+        new = rng.standard_normal(16).astype(np.float32)
+        [new_id] = store.add("b", ["new"], [new.tolist()])
+        (doc, score), = store.search(new.tolist(), top_k=1)
+
+        assert doc["id"] == new_id
+        assert score > 0.999
+    finally:
+        store._sharded.close()
@@ -1,22 +1,161 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.core.orchestrator import orchestrator
+from app.core.costs import BudgetExceeded
+from app.core.model_router import model_router
+from app.core.response_cache import response_cache
+from app.core.metrics_logger import metrics_writer
+from app.core.analytics import BUCKETS, default_window, query_analytics, rebuild_rollups
+import asyncio
+import json
 
 router = APIRouter()
 
+# How often a pending request checks whether its HTTP client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+class ClientDisconnected(Exception):
+    pass
+
+
 class QueryIn(BaseModel):
     model: str | None = None
     prompt: str
     variables: dict | None = None
+    stream: bool = False
+    cache: bool = True  # set false to force a fresh completion
+    max_tokens: int | None = None  # output cap sent to the model (default LLM_DEFAULT_MAX_OUTPUT_TOKENS)
+    max_cost_usd: float | None = None  # worst-case budget (default LLM_MAX_COST_PER_REQUEST_USD)
+    allow_downgrade: bool = True  # fall back to a cheaper model instead of rejecting
+    fallback: bool = True  # retry on another model after a timeout / 429 / 5xx
+    hedge: bool = False  # latency-critical: race a backup model once the primary is slow
 
-@router.post("/query")
-async def query_endpoint(payload: QueryIn):
+
+async def run_until_disconnect(request: Request, coro):
+    """
+    Await `coro`, cancelling it if the HTTP client disconnects first.
+    Raises ClientDisconnected in that case.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise ClientDisconnected()
+    finally:
+        # the handler itself was cancelled (e.g. server shutdown)
+        if not task.done():
+            task.cancel()
+
+
+async def sse_deltas(deltas):
+    """
+    Server-sent events: one `data: {"delta": ...}` per chunk, then `data: [DONE]`.
+    Failures mid-stream are sent as an `error` event since the status is already 200.
+    """
     try:
-        result = await orchestrator.run_model(
+        async for delta in deltas:
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield "data: [DONE]\n\n"
+    except asyncio.TimeoutError:
+        yield f"event: error\ndata: {json.dumps({'detail': 'LLM request timed out'})}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+
+@router.post("/query")
+async def query_endpoint(payload: QueryIn, request: Request):
+    if payload.stream:
+        # check the budget before the 200 goes out
+        try:
+            model_router.route(
+                payload.model, payload.prompt, payload.max_tokens, payload.max_cost_usd, payload.allow_downgrade,
+                fallback=False,
+            )
+        except BudgetExceeded as e:
+            raise HTTPException(status_code=402, detail=str(e))
+        # Starlette cancels the generator when the client disconnects
+        deltas = orchestrator.stream_model(
             model=payload.model,
             prompt=payload.prompt,
             variables=payload.variables or {},
+            use_cache=payload.cache,
+            max_tokens=payload.max_tokens,
+            max_cost_usd=payload.max_cost_usd,
+            allow_downgrade=payload.allow_downgrade,
+            fallback=payload.fallback,
+        )
+        return StreamingResponse(
+            sse_deltas(deltas),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
+
+    try:
+        result = await run_until_disconnect(request, orchestrator.run_model(
+            model=payload.model,
+            prompt=payload.prompt,
+            variables=payload.variables or {},
+            use_cache=payload.cache,
+            max_tokens=payload.max_tokens,
+            max_cost_usd=payload.max_cost_usd,
+            allow_downgrade=payload.allow_downgrade,
+            fallback=payload.fallback,
+            hedge=payload.hedge,
+        ))
         return result
+    except ClientDisconnected:
+        # nginx-style "client closed request"; nobody is listening for the body
+        return Response(status_code=499)
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=402, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats() if response_cache else {"enabled": False}
+
+
+@router.get("/router/stats")
+async def router_stats():
+    return model_router.stats()
+
+
+@router.get("/metrics/writer")
+async def metrics_writer_stats():
+    return metrics_writer.stats()
+
+
+@router.get("/analytics")
+async def analytics(
+    bucket: str = Query("hour"),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    model: str | None = None,
+):
+    """Per-model, per-bucket latency percentiles, tokens and cost (UTC, served from rollups)."""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(BUCKETS)}")
+    end = end or datetime.utcnow()
+    start = start or end - default_window(bucket)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    rows = await asyncio.to_thread(query_analytics, bucket, start, end, model)
+    return {"bucket": bucket, "start": start.isoformat(), "end": end.isoformat(), "series": rows}
+
+
+@router.post("/analytics/rebuild")
+async def analytics_rebuild(start: datetime | None = None):
+    """Recompute the rollups from the raw metrics, from `start` (whole hours) or from the beginning."""
+    replayed = await asyncio.to_thread(rebuild_rollups, start)
+    return {"replayed": replayed, "start": start.isoformat() if start else None}
@@ -0,0 +1,253 @@
+# services/llm_services/app/core/analytics.py
+"""
+Cost/latency analytics over llm_request_metrics.
+
+The metrics writer folds every batch it inserts into per-minute and per-hour
+rollups (counters + a fixed-bucket latency histogram) in the same transaction,
+so dashboards read a few rows per model per bucket instead of scanning the raw
+table. Percentiles are estimated from the histogram by linear interpolation
+inside the bin that holds the rank. Day buckets are summed from hour rollups.
+
+Minute rollups are kept for ANALYTICS_MINUTE_RETENTION_HOURS (pruned by the metrics
+writer); hour rollups are kept. rebuild_rollups (POST /api/analytics/rebuild) recomputes
+them from the raw table.
+"""
+
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.db.session import Base, SessionLocal, engine
+from app.models.analytics import GRANULARITIES, LATENCY_BOUNDS_MS, LLMMetricLatencyBin, LLMMetricRollup
+from app.models.metrics import LLMRequestMetric
+
+BUCKETS = ("minute", "hour", "day")
+# 0 keeps minute rollups forever
+MINUTE_RETENTION_HOURS = float(os.getenv("ANALYTICS_MINUTE_RETENTION_HOURS", 48))
+_COUNTERS = ("requests", "errors", "cached_requests", "input_tokens", "output_tokens", "total_tokens",
+             "cost_usd", "latency_sum_ms")
+
+
+def ensure_analytics_schema():
+    """Create the rollup tables and the (model_name, created_at) index on the raw table if missing."""
+    Base.metadata.create_all(engine, tables=[LLMMetricRollup.__table__, LLMMetricLatencyBin.__table__])
+    # create_all skips llm_request_metrics when it already exists, so add its index explicitly
+    for index in LLMRequestMetric.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_bin(latency_ms: float) -> int:
+    for i, bound in enumerate(LATENCY_BOUNDS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BOUNDS_MS) - 1
+
+
+def _dialect_insert(db):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert
+    return postgresql.insert
+
+
+def apply_rollups(db, rows: list[dict]):
+    """
+    Add a batch of raw metric rows to the rollup tables (atomic counter upserts).
+    Runs inside the caller's transaction; the caller commits.
+    """
+    rollups: dict = {}
+    bins: dict = defaultdict(int)
+    for row in rows:
+        model = row.get("model_name") or "default"
+        latency = float(row.get("latency_ms") or 0.0)
+        for granularity in GRANULARITIES:
+            key = (granularity, truncate(row["created_at"], granularity), model)
+            agg = rollups.setdefault(key, dict.fromkeys(_COUNTERS, 0))
+            agg["requests"] += 1
+            agg["errors"] += row.get("status") not in ("success", "cancelled")
+            agg["cached_requests"] += bool(row.get("cached"))
+            agg["input_tokens"] += row.get("input_tokens") or 0
+            agg["output_tokens"] += row.get("output_tokens") or 0
+            agg["total_tokens"] += row.get("total_tokens") or 0
+            agg["cost_usd"] += row.get("cost_usd") or 0.0
+            agg["latency_sum_ms"] += latency
+            bins[key + (latency_bin(latency),)] += 1
+    if not rollups:
+        return
+
+    insert = _dialect_insert(db)
+    stmt = insert(LLMMetricRollup)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["granularity", "bucket_start", "model_name"],
+            set_={c: getattr(LLMMetricRollup, c) + getattr(stmt.excluded, c) for c in _COUNTERS},
+        ),
+        [
+            {"granularity": g, "bucket_start": b, "model_name": m, **agg}
+            for (g, b, m), agg in rollups.items()
+        ],
+    )
+    stmt = insert(LLMMetricLatencyBin)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["granularity", "bucket_start", "model_name", "bin"],
+            set_={"count": LLMMetricLatencyBin.count + stmt.excluded.count},
+        ),
+        [
+            {"granularity": g, "bucket_start": b, "model_name": m, "bin": i, "count": n}
+            for (g, b, m, i), n in bins.items()
+        ],
+    )
+
+
+def rebuild_rollups(start: datetime | None = None, batch_size: int = 5000) -> int:
+    """
+    Recompute rollups from the raw table (backfill after enabling analytics, or repair).
+    Clears rollup buckets from `start` on (whole hours), then replays raw rows in id order.
+    Rows the metrics writer commits meanwhile can be counted twice: run it while traffic is low.
+    """
+    db = SessionLocal()
+    try:
+        since = truncate(start, "hour") if start else None
+        for model in (LLMMetricRollup, LLMMetricLatencyBin):
+            q = delete(model)
+            if since is not None:
+                q = q.where(model.bucket_start >= since)
+            db.execute(q)
+
+        cols = [LLMRequestMetric.id] + [
+            getattr(LLMRequestMetric, c) for c in (
+                "model_name", "input_tokens", "output_tokens", "total_tokens", "cost_usd",
+                "latency_ms", "status", "cached", "created_at",
+            )
+        ]
+        last_id, replayed = 0, 0
+        while True:
+            q = select(*cols).where(LLMRequestMetric.id > last_id)
+            if since is not None:
+                q = q.where(LLMRequestMetric.created_at >= since)
+            batch = db.execute(q.order_by(LLMRequestMetric.id).limit(batch_size)).mappings().all()
+            if not batch:
+                break
+            apply_rollups(db, [dict(r) for r in batch if r["created_at"] is not None])
+            last_id = batch[-1]["id"]
+            replayed += len(batch)
+        _prune(db, datetime.utcnow())
+        db.commit()
+        return replayed
+    finally:
+        db.close()
+
+
+def prune_rollups() -> int:
+    """Delete minute rollups older than MINUTE_RETENTION_HOURS. Returns the rows deleted."""
+    db = SessionLocal()
+    try:
+        deleted = _prune(db, datetime.utcnow())
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def _prune(db, now: datetime) -> int:
+    if MINUTE_RETENTION_HOURS <= 0:
+        return 0
+    cutoff = now - timedelta(hours=MINUTE_RETENTION_HOURS)
+    deleted = 0
+    for model in (LLMMetricRollup, LLMMetricLatencyBin):
+        deleted += db.execute(
+            delete(model).where(model.granularity == "minute", model.bucket_start < cutoff)
+        ).rowcount
+    return deleted
+
+
+def _percentile(hist: list[int], q: float) -> float | None:
+    total = sum(hist)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(hist):
+        if n and seen + n >= rank:
+            lo = LATENCY_BOUNDS_MS[i - 1] if i else 0.0
+            hi = LATENCY_BOUNDS_MS[i]
+            if hi == float("inf"):
+                # open-ended last bin: report its lower bound
+                return float(lo)
+            return lo + (hi - lo) * (rank - seen) / n
+        seen += n
+    return float(LATENCY_BOUNDS_MS[-2])
+
+
+def query_analytics(bucket: str, start: datetime, end: datetime, model: str | None = None) -> list[dict]:
+    """Per (model, bucket) request counts, tokens, cost, mean and p50/p95/p99 latency in [start, end)."""
+    source = "minute" if bucket == "minute" else "hour"
+    db = SessionLocal()
+    try:
+        filters = [
+            LLMMetricRollup.granularity == source,
+            LLMMetricRollup.bucket_start >= truncate(start, source),
+            LLMMetricRollup.bucket_start < end,
+        ]
+        if model:
+            filters.append(LLMMetricRollup.model_name == model)
+        rollups = db.execute(select(LLMMetricRollup).where(*filters)).scalars().all()
+
+        bin_filters = [
+            LLMMetricLatencyBin.granularity == source,
+            LLMMetricLatencyBin.bucket_start >= truncate(start, source),
+            LLMMetricLatencyBin.bucket_start < end,
+        ]
+        if model:
+            bin_filters.append(LLMMetricLatencyBin.model_name == model)
+        bins = db.execute(
+            select(LLMMetricLatencyBin.model_name, LLMMetricLatencyBin.bucket_start,
+                   LLMMetricLatencyBin.bin, LLMMetricLatencyBin.count).where(*bin_filters)
+        ).all()
+    finally:
+        db.close()
+
+    merged: dict = {}
+    for r in rollups:
+        key = (r.model_name, truncate(r.bucket_start, bucket))
+        agg = merged.setdefault(key, dict.fromkeys(_COUNTERS, 0))
+        for c in _COUNTERS:
+            agg[c] += getattr(r, c)
+    hists: dict = defaultdict(lambda: [0] * len(LATENCY_BOUNDS_MS))
+    for model_name, bucket_start, i, n in bins:
+        hists[(model_name, truncate(bucket_start, bucket))][i] += n
+
+    out = []
+    for (model_name, bucket_start), agg in sorted(merged.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        hist = hists[(model_name, bucket_start)]
+        out.append({
+            "model": model_name,
+            "bucket_start": bucket_start.isoformat(),
+            "requests": agg["requests"],
+            "errors": agg["errors"],
+            "cached_requests": agg["cached_requests"],
+            "input_tokens": agg["input_tokens"],
+            "output_tokens": agg["output_tokens"],
+            "total_tokens": agg["total_tokens"],
+            "cost_usd": round(agg["cost_usd"], 8),
+            "latency_avg_ms": agg["latency_sum_ms"] / agg["requests"] if agg["requests"] else None,
+            "latency_p50_ms": _percentile(hist, 0.50),
+            "latency_p95_ms": _percentile(hist, 0.95),
+            "latency_p99_ms": _percentile(hist, 0.99),
+        })
+    return out
+
+
+def default_window(bucket: str) -> timedelta:
+    return {"minute": timedelta(hours=1), "hour": timedelta(days=1), "day": timedelta(days=30)}[bucket]
@@ -1,39 +1,201 @@
 # services/llm_services/app/core/costs.py
+"""
+Pricing registry and per-request budgets.
 
-# OpenAI pricing — update anytime
+Prices are USD per 1K tokens, split into input, cached input and output.
+LLM_PRICING_FILE (JSON or YAML, same shape as MODEL_PRICES) overrides or extends
+the built-in table, so new models or price changes need no code change. An
+entry's optional "downgrade" names a cheaper model to try when a request's
+budget does not fit.
+"""
+
+import json
+import os
+
+# Per 1K tokens. cached_input_per_1k defaults to input_per_1k (no discount).
 MODEL_PRICES = {
+    # Groq
+    "llama-3.1-8b-instant": {
+        "input_per_1k": 0.00005,
+        "output_per_1k": 0.00008,
+    },
+    "llama-3.3-70b-versatile": {
+        "input_per_1k": 0.00059,
+        "output_per_1k": 0.00079,
+        "downgrade": "llama-3.1-8b-instant",
+    },
+    "meta-llama/llama-4-scout-17b-16e-instruct": {
+        "input_per_1k": 0.00011,
+        "output_per_1k": 0.00034,
+        "downgrade": "llama-3.1-8b-instant",
+    },
+    "meta-llama/llama-4-maverick-17b-128e-instruct": {
+        "input_per_1k": 0.0002,
+        "output_per_1k": 0.0006,
+        "downgrade": "meta-llama/llama-4-scout-17b-16e-instruct",
+    },
+    "openai/gpt-oss-20b": {
+        "input_per_1k": 0.0001,
+        "cached_input_per_1k": 0.00005,
+        "output_per_1k": 0.0005,
+        "downgrade": "llama-3.1-8b-instant",
+    },
+    "openai/gpt-oss-120b": {
+        "input_per_1k": 0.00015,
+        "cached_input_per_1k": 0.000075,
+        "output_per_1k": 0.00075,
+        "downgrade": "openai/gpt-oss-20b",
+    },
+    "qwen/qwen3-32b": {
+        "input_per_1k": 0.00029,
+        "output_per_1k": 0.00059,
+        "downgrade": "llama-3.1-8b-instant",
+    },
+    "moonshotai/kimi-k2-instruct": {
+        "input_per_1k": 0.001,
+        "cached_input_per_1k": 0.0005,
+        "output_per_1k": 0.003,
+        "downgrade": "llama-3.3-70b-versatile",
+    },
+    # OpenAI
     "gpt-4o": {
         "input_per_1k": 0.005,
+        "cached_input_per_1k": 0.0025,
         "output_per_1k": 0.015,
+        "downgrade": "gpt-4o-mini",
     },
     "gpt-4o-mini": {
         "input_per_1k": 0.0006,
+        "cached_input_per_1k": 0.0003,
         "output_per_1k": 0.0024,
     },
-    # add more models as needed
 }
 
-def estimate_cost(model_name: str, total_tokens: int) -> float:
-    """
-    Estimate approximate cost in USD based on token usage.
-    OpenAI counts input & output separately but
-    total_tokens is fine for early metrics.
-    """
+LLM_PRICING_FILE = os.getenv("LLM_PRICING_FILE")
+# Budget applied when a request sets none; unset = unlimited
+LLM_MAX_COST_PER_REQUEST_USD = os.getenv("LLM_MAX_COST_PER_REQUEST_USD")
+# Output tokens assumed (and sent as max_tokens) when a budgeted request sets no max_tokens
+LLM_DEFAULT_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_DEFAULT_MAX_OUTPUT_TOKENS", 1024))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def load_prices(path: str | None = LLM_PRICING_FILE) -> dict:
+    prices = {name: dict(entry) for name, entry in MODEL_PRICES.items()}
+    if not path:
+        return prices
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                import yaml
+                overrides = yaml.safe_load(f) or {}
+            else:
+                overrides = json.load(f)
+    except Exception as e:
+        print("[costs] Failed to load pricing file, using built-in prices:", e)
+        return prices
+    for name, entry in overrides.items():
+        prices.setdefault(name, {}).update(entry)
+    return prices
+
+
+def count_prompt_tokens(prompt: str) -> int:
+    """Input tokens of a prompt: tiktoken when installed, else ~4 chars per token."""
+    if _encoding is not None:
+        return len(_encoding.encode(prompt, disallowed_special=()))
+    return max(1, len(prompt) // 4)
+
+
+def cached_prompt_tokens(usage) -> int:
+    """Prompt tokens served from the provider's prompt cache, when it reports them."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+class PricingRegistry:
+    def __init__(self, prices: dict):
+        self.prices = prices
+        self._warned: set = set()
+
+    def price(self, model: str) -> dict | None:
+        entry = self.prices.get(model)
+        if entry is None and model not in self._warned:
+            self._warned.add(model)
+            print(f"[costs] No pricing for model {model!r}; its cost is recorded as 0")
+        return entry
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+        entry = self.price(model)
+        if entry is None:
+            return 0.0
+        cached_tokens = min(cached_tokens, input_tokens)
+        cached_rate = entry.get("cached_input_per_1k", entry["input_per_1k"])
+        return (
+            (input_tokens - cached_tokens) / 1000 * entry["input_per_1k"]
+            + cached_tokens / 1000 * cached_rate
+            + output_tokens / 1000 * entry["output_per_1k"]
+        )
+
+    def max_cost(self, model: str, input_tokens: int, max_output_tokens: int) -> float | None:
+        """Worst-case cost of a request (no prompt-cache discount, every output token used)."""
+        if model not in self.prices:
+            return None
+        return self.cost(model, input_tokens, max_output_tokens)
+
+    def budget(self, max_cost_usd: float | None = None) -> float | None:
+        """The request's budget, or the LLM_MAX_COST_PER_REQUEST_USD default; None = unlimited."""
+        if max_cost_usd is None and LLM_MAX_COST_PER_REQUEST_USD:
+            return float(LLM_MAX_COST_PER_REQUEST_USD)
+        return max_cost_usd
+
+    def fits(self, model: str, input_tokens: int, max_tokens: int, budget: float | None) -> bool:
+        if budget is None:
+            return True
+        estimate = self.max_cost(model, input_tokens, max_tokens)
+        return estimate is not None and estimate <= budget
 
-    if model_name not in MODEL_PRICES:
-        return 0.0
+    def plan(self, model: str, prompt: str, max_tokens: int | None = None,
+             max_cost_usd: float | None = None, allow_downgrade: bool = True) -> tuple[str, int | None]:
+        """
+        Pick the model to send a request to under its budget. Returns (model, max_tokens).
+        Walks the model's downgrade chain when the worst-case cost is over budget;
+        raises BudgetExceeded when nothing in the chain fits.
+        Without a budget max_tokens is returned as given (None = provider default); under
+        one it defaults to LLM_DEFAULT_MAX_OUTPUT_TOKENS, so the worst case stays bounded.
+        """
+        max_cost_usd = self.budget(max_cost_usd)
+        if max_cost_usd is None:
+            return model, max_tokens
+        max_tokens = max_tokens or LLM_DEFAULT_MAX_OUTPUT_TOKENS
 
-    # Cost per 1K tokens (approx)
-    price_per_1k = MODEL_PRICES[model_name]["output_per_1k"]
+        input_tokens = count_prompt_tokens(prompt)
+        requested = self.max_cost(model, input_tokens, max_tokens)
+        if requested is None:
+            raise BudgetExceeded(f"No pricing for model {model!r}; cannot enforce a budget")
+        candidate, visited = model, set()
+        while candidate in self.prices and candidate not in visited:
+            visited.add(candidate)
+            if self.fits(candidate, input_tokens, max_tokens, max_cost_usd):
+                return candidate, max_tokens
+            if not allow_downgrade:
+                break
+            candidate = self.prices[candidate].get("downgrade")
+        raise BudgetExceeded(
+            f"Estimated cost of up to ${requested:.6f} for {model!r} exceeds the ${max_cost_usd:.6f} budget"
+        )
 
-    return (total_tokens / 1000) * price_per_1k
 
+pricing = PricingRegistry(load_prices())
 
 
-# MODEL_COSTS = {
-#     # per 1K tokens
-#     "gpt-4-turbo": {"input": 0.01, "output": 0.03},
-#     "gpt-4o": {"input": 0.005, "output": 0.015},
-#     "gpt-3.5-turbo": {"input": 0.001, "output": 0.002},
-#     # fallback defaults
-# }
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """Cost in USD of a completed request, input and output priced separately."""
+    return pricing.cost(model_name, input_tokens, output_tokens, cached_tokens)
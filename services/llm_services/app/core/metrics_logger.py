@@ -1,8 +1,220 @@
 # services/llm_services/app/core/metrics_logger.py
 
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from app.core.analytics import apply_rollups, prune_rollups
 from app.db.session import SessionLocal
 from app.models.metrics import LLMRequestMetric
 import asyncio
+import json
+import os
+import time
+
+# Rows are buffered in memory and bulk-inserted by a background flusher when
+# METRICS_BATCH_SIZE rows are queued or every METRICS_FLUSH_INTERVAL_MS.
+METRICS_QUEUE_SIZE = int(os.getenv("METRICS_QUEUE_SIZE", 10000))
+METRICS_BATCH_SIZE = int(os.getenv("METRICS_BATCH_SIZE", 500))
+METRICS_FLUSH_INTERVAL_MS = float(os.getenv("METRICS_FLUSH_INTERVAL_MS", 1000))
+# Where rows go when the queue is full or the DB write fails (JSON lines); unset = drop them
+METRICS_SPILL_PATH = os.getenv("METRICS_SPILL_PATH")
+# Spilled rows are replayed once the queue drains; while the DB is unreachable, replay
+# waits with exponential back-off (from METRICS_FLUSH_INTERVAL_MS up to this cap)
+METRICS_REPLAY_BACKOFF_MAX_MS = float(os.getenv("METRICS_REPLAY_BACKOFF_MAX_MS", 60000))
+# How often the flusher drops minute rollups past their retention (see analytics.py)
+ROLLUP_PRUNE_INTERVAL_S = float(os.getenv("ROLLUP_PRUNE_INTERVAL_S", 3600))
+
+
+# Queued by stop(): the flusher writes what it holds and exits. A sentinel rather than
+# Task.cancel(), which asyncio.wait_for can swallow on Python < 3.12.
+_STOP = object()
+
+
+class MetricsWriter:
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._backoff = 0.0         # seconds; 0 while the DB is reachable
+        self._replay_at = 0.0       # monotonic time before which spilled rows are not replayed
+        self._pruned_at = time.monotonic()
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=METRICS_QUEUE_SIZE)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still queued."""
+        if self._task is not None:
+            if not self._task.done():
+                await self._queue.put(_STOP)
+                await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._queue is not None:
+            rows = []
+            while not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is not _STOP:
+                    rows.append(row)
+            for i in range(0, len(rows), METRICS_BATCH_SIZE):
+                await self._write(rows[i:i + METRICS_BATCH_SIZE])
+
+    def submit(self, row: dict):
+        """Never blocks the caller: a full queue spills to file (or drops)."""
+        if self._task is None or self._task.done():
+            # outside the app lifespan (scripts/tests): start lazily on this loop
+            self._queue = self._queue or asyncio.Queue(maxsize=METRICS_QUEUE_SIZE)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self._spill([row])
+
+    async def _run(self):
+        interval = METRICS_FLUSH_INTERVAL_MS / 1000
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            rows = [first]
+            deadline = time.monotonic() + interval
+            while len(rows) < METRICS_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                rows.append(row)
+            await self._write(rows)
+            if not stopping and self._queue.empty():
+                await self._replay_spill()
+                await self._maybe_prune()
+
+    async def _write(self, rows: list[dict]) -> bool:
+        """
+        Insert `rows`; False when the DB is unreachable (the rows were spilled). A row the
+        DB rejects is logged and dropped, found by splitting the batch, so it cannot take
+        the rest of the batch with it or be replayed forever.
+        """
+        def _insert():
+            db = SessionLocal()
+            try:
+                db.execute(insert(LLMRequestMetric), rows)
+                # rollups commit together with the raw rows, so a retried batch is never double-counted;
+                # in a savepoint, so a rollup failure cannot cost the raw rows
+                try:
+                    with db.begin_nested():
+                        apply_rollups(db, rows)
+                except Exception as e:
+                    print("[metrics_logger] Rollup update failed, raw rows kept (repair: POST /api/analytics/rebuild):", e)
+                db.commit()
+            finally:
+                db.close()
+
+        try:
+            await asyncio.to_thread(_insert)
+        except (OperationalError, InterfaceError) as e:
+            print("[metrics_logger] Metrics DB unavailable, spilling batch:", e)
+            self._back_off()
+            self._spill(rows)
+            return False
+        except Exception as e:
+            if len(rows) == 1:
+                print("[metrics_logger] Dropping metric row rejected by the DB:", e, rows[0])
+                self.dropped += 1
+                return True
+            mid = len(rows) // 2
+            if not await self._write(rows[:mid]):
+                self._spill(rows[mid:])
+                return False
+            return await self._write(rows[mid:])
+        self.written += len(rows)
+        self._backoff = 0.0
+        return True
+
+    def _back_off(self):
+        self._backoff = min(
+            max(self._backoff * 2, METRICS_FLUSH_INTERVAL_MS / 1000), METRICS_REPLAY_BACKOFF_MAX_MS / 1000
+        )
+        self._replay_at = time.monotonic() + self._backoff
+
+    async def _maybe_prune(self):
+        if time.monotonic() - self._pruned_at < ROLLUP_PRUNE_INTERVAL_S:
+            return
+        self._pruned_at = time.monotonic()
+        try:
+            await asyncio.to_thread(prune_rollups)
+        except Exception as e:
+            print("[metrics_logger] Rollup pruning failed:", e)
+
+    def _spill(self, rows: list[dict]):
+        if not METRICS_SPILL_PATH:
+            self.dropped += len(rows)
+            return
+        try:
+            with open(METRICS_SPILL_PATH, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+            self.spilled += len(rows)
+        except OSError as e:
+            print("[metrics_logger] Failed to spill metrics:", e)
+            self.dropped += len(rows)
+
+    async def _replay_spill(self):
+        """Load spilled rows back into the DB once the queue has drained (and the back-off has passed)."""
+        if not METRICS_SPILL_PATH or time.monotonic() < self._replay_at:
+            return
+        replay_path = METRICS_SPILL_PATH + ".replay"
+        try:
+            # a replay that was cut short (crash, restart) left its file: finish it before taking the next one
+            if not os.path.exists(replay_path):
+                if not os.path.exists(METRICS_SPILL_PATH):
+                    return
+                os.replace(METRICS_SPILL_PATH, replay_path)
+            with open(replay_path, encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+        except OSError as e:
+            print("[metrics_logger] Failed to read spilled metrics:", e)
+            return
+        rows = []
+        for line in lines:
+            try:
+                row = json.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+            except (ValueError, TypeError, KeyError) as e:
+                print("[metrics_logger] Skipping unreadable spilled metric:", e)
+                self.dropped += 1
+                continue
+            rows.append(row)
+        # rows left by an earlier process were never counted here
+        self.spilled = max(0, self.spilled - len(lines))
+        for i in range(0, len(rows), METRICS_BATCH_SIZE):
+            # _write spills a batch the DB could not take; the rest goes back untried until the back-off passes
+            if not await self._write(rows[i:i + METRICS_BATCH_SIZE]):
+                self._spill(rows[i + METRICS_BATCH_SIZE:])
+                break
+        os.remove(replay_path)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
+
+
+metrics_writer = MetricsWriter()
+
 
 async def save_metric(
     model_name: str,
@@ -16,33 +228,19 @@ async def save_metric(
     cached: bool,
 ):
     """
-    This function wraps synchronous DB operations inside a thread executor,
-    making it safe to await.
+    Queue a metric row for the background writer and return immediately,
+    keeping the DB write off the request's critical path.
     """
-
-    def _write():
-        try:
-            db = SessionLocal()
-
-            metric = LLMRequestMetric(
-                model_name=model_name,
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens,
-                cost_usd=cost_usd,
-                latency_ms=latency_ms,
-                status=status,
-                prompt_preview=prompt_preview,
-                cached=1 if cached else 0,
-            )
-
-            db.add(metric)
-            db.commit()
-            db.refresh(metric)
-            db.close()
-
-        except Exception as e:
-            print("[metrics_logger] Failed to persist metric:", e)
-
-    # Run sync DB write in separate thread
-    await asyncio.to_thread(_write)
+    metrics_writer.submit({
+        "model_name": model_name,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+        "cost_usd": cost_usd,
+        "latency_ms": latency_ms,
+        "status": status,
+        "prompt_preview": prompt_preview,
+        "cached": bool(cached),
+        # stamped at submit time, not at flush time
+        "created_at": datetime.utcnow(),
+    })
@@ -0,0 +1,166 @@
+# services/llm_services/app/core/model_router.py
+"""
+Cost/latency-aware model selection.
+
+Each worker keeps a sliding window of recent outcomes per model (latency, and
+whether the call failed). When a request names no model, the candidates in
+LLM_ROUTER_MODELS are ranked by a weighted score of:
+
+- expected cost for this prompt (pricing registry, prompt tokens + expected output)
+- live p95 latency
+- live error rate
+
+Prompts of at least LLM_ROUTER_LONG_PROMPT_TOKENS prefer LLM_ROUTER_LONG_PROMPT_MODELS.
+Models over the request's budget are dropped. Models failing more than
+LLM_ROUTER_MAX_ERROR_RATE are moved to the back as a last resort.
+The ranked list after the first model is the fallback chain.
+"""
+
+import os
+import time
+from collections import deque
+
+from app.core.costs import LLM_DEFAULT_MAX_OUTPUT_TOKENS, BudgetExceeded, count_prompt_tokens, pricing
+
+
+def _models(value: str) -> list[str]:
+    return [m.strip() for m in value.split(",") if m.strip()]
+
+
+ROUTER_MODELS = _models(os.getenv(
+    "LLM_ROUTER_MODELS", "llama-3.1-8b-instant,llama-3.3-70b-versatile,openai/gpt-oss-120b"
+))
+LONG_PROMPT_TOKENS = int(os.getenv("LLM_ROUTER_LONG_PROMPT_TOKENS", 2000))
+LONG_PROMPT_MODELS = set(_models(os.getenv(
+    "LLM_ROUTER_LONG_PROMPT_MODELS", "llama-3.3-70b-versatile,openai/gpt-oss-120b"
+)))
+# Output length assumed when comparing costs (max_tokens is only the worst case)
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_ROUTER_EXPECTED_OUTPUT_TOKENS", 256))
+COST_WEIGHT = float(os.getenv("LLM_ROUTER_COST_WEIGHT", 0.5))
+LATENCY_WEIGHT = float(os.getenv("LLM_ROUTER_LATENCY_WEIGHT", 0.5))
+ERROR_WEIGHT = float(os.getenv("LLM_ROUTER_ERROR_WEIGHT", 2.0))
+WINDOW_SECONDS = float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", 300))
+WINDOW_MAX_SAMPLES = int(os.getenv("LLM_ROUTER_WINDOW_MAX_SAMPLES", 500))
+# Below this many samples a model's stats are not trusted (prior p95, no error penalty)
+MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", 5))
+MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", 0.5))
+DEFAULT_P95_MS = float(os.getenv("LLM_ROUTER_DEFAULT_P95_MS", 2000))
+MAX_FALLBACKS = int(os.getenv("LLM_ROUTER_MAX_FALLBACKS", 2))
+# Hedged requests start the backup after the primary's p95, clamped to this range
+HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", 200))
+HEDGE_MAX_DELAY_MS = float(os.getenv("LLM_HEDGE_MAX_DELAY_MS", 5000))
+
+
+class ModelStats:
+    def __init__(self):
+        self.samples: deque = deque(maxlen=WINDOW_MAX_SAMPLES)  # (monotonic ts, latency_ms, ok or None if censored)
+
+    def record(self, latency_ms: float, ok: bool | None):
+        self.samples.append((time.monotonic(), latency_ms, ok))
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def snapshot(self) -> dict:
+        recent = self._recent()
+        if len(recent) < MIN_SAMPLES:
+            return {"samples": len(recent), "p95_ms": None, "error_rate": None}
+        # censored samples (ok=None) enter the p95 at their elapsed time, a lower bound of the
+        # real latency; dropping them would leave out exactly the slow calls a hedge gave up on
+        latencies = sorted(s[1] for s in recent)
+        finished = [s for s in recent if s[2] is not None]
+        return {
+            "samples": len(recent),
+            "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "error_rate": sum(1 for s in finished if not s[2]) / max(1, len(finished)),
+        }
+
+
+class ModelRouter:
+    def __init__(self, models: list[str]):
+        self.models = models
+        self._stats: dict[str, ModelStats] = {}
+
+    def _for(self, model: str) -> ModelStats:
+        if model not in self._stats:
+            self._stats[model] = ModelStats()
+        return self._stats[model]
+
+    def record(self, model: str, latency_ms: float, ok: bool | None):
+        """ok=None marks a censored sample: the call was cancelled, so latency_ms is a lower bound."""
+        self._for(model).record(latency_ms, ok)
+
+    def p95(self, model: str) -> float:
+        return self._for(model).snapshot()["p95_ms"] or DEFAULT_P95_MS
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait on `model` before starting a hedged backup request."""
+        return min(max(self.p95(model), HEDGE_MIN_DELAY_MS), HEDGE_MAX_DELAY_MS) / 1000
+
+    def rank(self, prompt: str, max_tokens: int | None = None, max_cost_usd: float | None = None,
+             exclude: tuple = ()) -> list[str]:
+        """Candidate models for `prompt`, best first, all within the request's budget."""
+        max_tokens = max_tokens or LLM_DEFAULT_MAX_OUTPUT_TOKENS
+        budget = pricing.budget(max_cost_usd)
+        input_tokens = count_prompt_tokens(prompt)
+        pool = [
+            m for m in self.models
+            if m not in exclude and pricing.fits(m, input_tokens, max_tokens, budget)
+        ]
+        if not pool:
+            return []
+
+        expected_output = min(max_tokens, EXPECTED_OUTPUT_TOKENS)
+        costs = {m: pricing.cost(m, input_tokens, expected_output) for m in pool}
+        stats = {m: self._for(m).snapshot() for m in pool}
+        p95s = {m: stats[m]["p95_ms"] or DEFAULT_P95_MS for m in pool}
+        max_cost = max(costs.values()) or 1.0
+        max_p95 = max(p95s.values()) or 1.0
+
+        def score(m: str) -> tuple:
+            error_rate = stats[m]["error_rate"] or 0.0
+            unhealthy = error_rate > MAX_ERROR_RATE
+            # long prompts: stronger models first, then the rest
+            wrong_size = input_tokens >= LONG_PROMPT_TOKENS and m not in LONG_PROMPT_MODELS
+            weighted = (
+                COST_WEIGHT * costs[m] / max_cost
+                + LATENCY_WEIGHT * p95s[m] / max_p95
+                + ERROR_WEIGHT * error_rate
+            )
+            return (unhealthy, wrong_size, weighted)
+
+        return sorted(pool, key=score)
+
+    def route(self, model: str | None, prompt: str, max_tokens: int | None = None,
+              max_cost_usd: float | None = None, allow_downgrade: bool = True,
+              fallback: bool = True) -> tuple[list[str], int | None]:
+        """
+        Models to try for a request, in order, and the max_tokens to send (None = provider
+        default, only when no budget applies; see PricingRegistry.plan).
+        An explicit `model` (after any budget downgrade) goes first; otherwise the best-ranked one.
+        Raises BudgetExceeded when no model fits the budget.
+        """
+        if model:
+            primary, max_tokens = pricing.plan(model, prompt, max_tokens, max_cost_usd, allow_downgrade)
+            chain = [primary]
+        else:
+            if pricing.budget(max_cost_usd) is not None:
+                max_tokens = max_tokens or LLM_DEFAULT_MAX_OUTPUT_TOKENS
+            chain = self.rank(prompt, max_tokens, max_cost_usd)[:1]
+            if not chain:
+                raise BudgetExceeded("No routable model fits the request's budget")
+        if fallback:
+            chain += self.rank(prompt, max_tokens, max_cost_usd, exclude=tuple(chain))[:MAX_FALLBACKS]
+        return chain, max_tokens
+
+    def stats(self) -> dict:
+        return {
+            model: {**self._for(model).snapshot(), "hedge_delay_ms": self.hedge_delay(model) * 1000}
+            for model in dict.fromkeys(self.models + list(self._stats))
+        }
+
+
+model_router = ModelRouter(ROUTER_MODELS)
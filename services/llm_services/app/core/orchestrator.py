@@ -1,30 +1,171 @@
 # services/llm_services/app/core/orchestrator.py
 
-from groq import Groq
-from app.core.costs import estimate_cost
+from groq import NOT_GIVEN, APIConnectionError, APIStatusError, AsyncGroq
+from app.core.costs import cached_prompt_tokens, estimate_cost
+from app.core.model_router import model_router
 from app.core.metrics_logger import save_metric
+from app.core.response_cache import response_cache
+import asyncio
 import time
 import os
 
-# Load Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Load async Groq client: completions are awaited, so a slow one never blocks the worker
+client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+# Max in-flight completions per model on this worker, and end-to-end timeout per call
+MAX_CONCURRENCY_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", 64))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", 60))
+# A model that has not answered within this long is abandoned for the next one in its
+# fallback chain (the last model may use whatever is left of REQUEST_TIMEOUT_SECONDS)
+FALLBACK_TIMEOUT_SECONDS = float(os.getenv("LLM_FALLBACK_TIMEOUT_SECONDS", 20))
+# Upstream statuses worth retrying on another model
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, APIConnectionError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code in RETRYABLE_STATUSES
+
 
 class Orchestrator:
-    async def run_model(self, model: str, prompt: str, variables: dict):
-        start = time.monotonic()
+    def __init__(self):
+        self._limits: dict[str, asyncio.Semaphore] = {}
 
-        try:
-            # --- Call sync OpenAI API inside async function ---
-            # The trick is: run sync code directly in async (it's allowed)
-            response = client.chat.completions.create(
+    def _limit(self, model: str) -> asyncio.Semaphore:
+        key = model or ""
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(MAX_CONCURRENCY_PER_MODEL)
+        return self._limits[key]
+
+    async def _complete(self, model: str, prompt: str, max_tokens: int | None):
+        # waiting for a slot counts toward the timeout too
+        async with self._limit(model):
+            return await client.chat.completions.create(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens or NOT_GIVEN,
             )
 
+    async def _cached(self, model: str, prompt: str, variables: dict, max_tokens: int | None,
+                      start: float) -> dict | None:
+        """Return a cached answer (recorded as a zero-cost cached metric), or None."""
+        if response_cache is None:
+            return None
+        hit = await response_cache.get(model, prompt, variables, max_tokens)
+        if hit is None:
+            return None
+        usage = hit.get("usage") or {}
+        await save_metric(
+            model_name=model,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            cost_usd=0.0,
+            latency_ms=(time.monotonic() - start) * 1000,
+            status="success",
+            prompt_preview=prompt[:200],
+            cached=True,
+        )
+        return hit
+
+    async def _remember(self, model: str, prompt: str, variables: dict, max_tokens: int | None, text: str, usage):
+        if response_cache is None:
+            return
+        await response_cache.put(model, prompt, variables, max_tokens=max_tokens, value={
+            "response": text,
+            "usage": {
+                "input_tokens": usage.prompt_tokens if usage else 0,
+                "output_tokens": usage.completion_tokens if usage else 0,
+                "total_tokens": usage.total_tokens if usage else 0,
+            },
+        })
+
+    async def run_model(self, model: str | None, prompt: str, variables: dict, use_cache: bool = True,
+                        max_tokens: int | None = None, max_cost_usd: float | None = None,
+                        allow_downgrade: bool = True, fallback: bool = True, hedge: bool = False):
+        """
+        Complete `prompt` on `model`, or on the router's pick when model is None.
+
+        - budget: raises BudgetExceeded (before anything is sent) when no model fits `max_cost_usd`
+        - fallback: on a timeout / 429 / 5xx the next model of the chain is tried
+        - hedge: for latency-critical calls a backup request is started once the primary
+          has been running for its p95; the first success wins, the other is cancelled
+        REQUEST_TIMEOUT_SECONDS bounds the whole call.
+        """
+        start = time.monotonic()
+        chain, max_tokens = model_router.route(model, prompt, max_tokens, max_cost_usd, allow_downgrade, fallback)
+
+        if use_cache:
+            hit = await self._cached(chain[0], prompt, variables, max_tokens, start)
+            if hit is not None:
+                return {"response": hit["response"], "model": chain[0], "cost_usd": 0.0, "cached": True}
+
+        used, (text, usage, cost) = await self._run_chain(chain, prompt, max_tokens, hedge)
+        if use_cache:
+            # a fallback's answer is cached as that model's, never served as chain[0]'s
+            await self._remember(used, prompt, variables, max_tokens, text, usage)
+
+        return {"response": text, "model": used, "cost_usd": cost}
+
+    async def _run_chain(self, chain: list[str], prompt: str, max_tokens: int | None, hedge: bool):
+        """Try the models of `chain` in order (overlapping them when hedging). Returns (model, result)."""
+        deadline = time.monotonic() + REQUEST_TIMEOUT_SECONDS
+        queue = list(chain)
+        running: dict[asyncio.Task, str] = {}
+        last_error = None
+
+        def launch():
+            m = queue.pop(0)
+            # only the last model may run up to the overall deadline
+            budget = deadline - time.monotonic()
+            timeout = budget if not queue else min(budget, FALLBACK_TIMEOUT_SECONDS)
+            running[asyncio.ensure_future(self._attempt(m, prompt, max_tokens, timeout))] = m
+
+        launch()
+        try:
+            while running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                wait = remaining
+                if hedge and queue:
+                    wait = min(wait, model_router.hedge_delay(chain[0]))
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge and queue:
+                        launch()
+                    continue
+                for task in done:
+                    m = running.pop(task)
+                    if task.exception() is None:
+                        return m, task.result()
+                    last_error = task.exception()
+                    if not is_retryable(last_error):
+                        raise last_error
+                    print(f"[orchestrator] {m} failed ({type(last_error).__name__}), falling back")
+                if not running and queue:
+                    launch()
+            raise last_error
+        finally:
+            # the losing hedge (or anything still running when we give up) is cancelled
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def _attempt(self, model: str, prompt: str, max_tokens: int | None, timeout: float):
+        """One completion on one model, recorded in metrics and in the router's health window."""
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self._complete(model, prompt, max_tokens), timeout=timeout)
+
             text = response.choices[0].message.content
             usage = response.usage
 
             latency = (time.monotonic() - start) * 1000
+            cost = estimate_cost(model, usage.prompt_tokens, usage.completion_tokens, cached_prompt_tokens(usage))
+            model_router.record(model, latency, ok=True)
 
             # Save metrics
             await save_metric(
@@ -32,31 +173,149 @@ class Orchestrator:
                 input_tokens=usage.prompt_tokens,
                 output_tokens=usage.completion_tokens,
                 total_tokens=usage.total_tokens,
-                cost_usd=estimate_cost(model, usage.total_tokens),
+                cost_usd=cost,
                 latency_ms=latency,
                 status="success",
                 prompt_preview=prompt[:200],
                 cached=False,
             )
+            return text, usage, cost
 
-            return {"response": text}
+        except asyncio.CancelledError:
+            # caller went away (e.g. HTTP client disconnected) or a hedge lost; the upstream request is aborted.
+            # The elapsed time still goes to the router as a lower bound, or losing hedges would bias p95 low
+            model_router.record(model, (time.monotonic() - start) * 1000, ok=None)
+            await self._save_failure(model, prompt, start, "cancelled")
+            raise
 
         except Exception as e:
-            latency = (time.monotonic() - start) * 1000
+            status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            model_router.record(model, (time.monotonic() - start) * 1000, ok=False)
+            await self._save_failure(model, prompt, start, status)
+
+            raise e
+
+    async def stream_model(self, model: str | None, prompt: str, variables: dict, use_cache: bool = True,
+                           max_tokens: int | None = None, max_cost_usd: float | None = None,
+                           allow_downgrade: bool = True, fallback: bool = True):
+        """
+        Async generator of text deltas, routed and budgeted as in run_model.
+        Falls back to the next model only while nothing has been yielded yet.
+        A cache hit is yielded as a single delta.
+        """
+        start = time.monotonic()
+        chain, max_tokens = model_router.route(model, prompt, max_tokens, max_cost_usd, allow_downgrade, fallback)
+
+        if use_cache:
+            hit = await self._cached(chain[0], prompt, variables, max_tokens, start)
+            if hit is not None:
+                yield hit["response"]
+                return
+
+        deadline = start + REQUEST_TIMEOUT_SECONDS
+        for i, m in enumerate(chain):
+            last = i == len(chain) - 1
+            first_timeout = deadline - time.monotonic()
+            if not last:
+                first_timeout = min(first_timeout, FALLBACK_TIMEOUT_SECONDS)
+            parts, outcome = [], {}
+            attempt = self._stream_attempt(m, prompt, max_tokens, first_timeout, outcome)
+            try:
+                async for delta in attempt:
+                    parts.append(delta)
+                    yield delta
+            except Exception as e:
+                if parts or last or not is_retryable(e):
+                    raise
+                print(f"[orchestrator] {m} failed ({type(e).__name__}) before streaming, falling back")
+                continue
+            finally:
+                # close the upstream stream now if our consumer went away mid-stream
+                await attempt.aclose()
+            if use_cache:
+                await self._remember(m, prompt, variables, max_tokens, "".join(parts), outcome.get("usage"))
+            return
 
+    async def _stream_attempt(self, model: str, prompt: str, max_tokens: int | None, first_timeout: float, outcome: dict):
+        """
+        Stream one model. Holds the model's concurrency slot for the whole stream;
+        `first_timeout` bounds the wait for the first chunk, REQUEST_TIMEOUT_SECONDS
+        each later one. Metrics are recorded once the stream finishes, fails or is
+        cancelled; the final usage is left in outcome["usage"].
+        """
+        start = time.monotonic()
+        usage = None
+        timeout = first_timeout
+        try:
+            async with self._limit(model):
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=max_tokens or NOT_GIVEN,
+                        stream=True,
+                    ),
+                    timeout=timeout,
+                )
+                # closes the HTTP response on every exit: end, timeout, error or disconnect
+                async with stream:
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                        except StopAsyncIteration:
+                            break
+                        timeout = REQUEST_TIMEOUT_SECONDS
+                        # Groq reports usage on the last chunk under x_groq; OpenAI-style on .usage
+                        x_groq = getattr(chunk, "x_groq", None)
+                        usage = getattr(chunk, "usage", None) or (getattr(x_groq, "usage", None) if x_groq else None) or usage
+                        if chunk.choices:
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                yield delta
+
+            latency = (time.monotonic() - start) * 1000
+            model_router.record(model, latency, ok=True)
+            outcome["usage"] = usage
             await save_metric(
                 model_name=model,
-                input_tokens=0,
-                output_tokens=0,
-                total_tokens=0,
-                cost_usd=0,
+                input_tokens=usage.prompt_tokens if usage else 0,
+                output_tokens=usage.completion_tokens if usage else 0,
+                total_tokens=usage.total_tokens if usage else 0,
+                cost_usd=estimate_cost(
+                    model, usage.prompt_tokens, usage.completion_tokens, cached_prompt_tokens(usage)
+                ) if usage else 0,
                 latency_ms=latency,
-                status="error",
+                status="success",
                 prompt_preview=prompt[:200],
                 cached=False,
             )
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # consumer stopped reading (client disconnected)
+            await asyncio.shield(self._save_failure(model, prompt, start, "cancelled"))
+            raise
+
+        except Exception as e:
+            status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            model_router.record(model, (time.monotonic() - start) * 1000, ok=False)
+            await self._save_failure(model, prompt, start, status)
             raise e
 
+    async def _save_failure(self, model: str, prompt: str, start: float, status: str):
+        latency = (time.monotonic() - start) * 1000
+
+        await save_metric(
+            model_name=model,
+            input_tokens=0,
+            output_tokens=0,
+            total_tokens=0,
+            cost_usd=0,
+            latency_ms=latency,
+            status=status,
+            prompt_preview=prompt[:200],
+            cached=False,
+        )
+
 
 orchestrator = Orchestrator()
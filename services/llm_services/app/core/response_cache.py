@@ -0,0 +1,224 @@
+# services/llm_services/app/core/response_cache.py
+"""
+Prompt/response cache for the orchestrator.
+
+- Exact match: key = sha256(model, whitespace-normalized prompt, sorted variables,
+  max_tokens: a reply truncated by a lower limit is never served for a higher one),
+  stored in a pluggable backend (in-process LRU+TTL by default, Redis when
+  LLM_CACHE_REDIS_URL is set so every worker shares hits).
+- Semantic (optional, LLM_SEMANTIC_CACHE=1): prompts are embedded through the
+  embeddings service; a new prompt whose cosine similarity to a cached prompt of
+  the same model, variables and max_tokens is >= LLM_SEMANTIC_CACHE_THRESHOLD
+  reuses that answer.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 3600))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL")
+
+SEMANTIC_CACHE = os.getenv("LLM_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_MAX_ENTRIES = int(os.getenv("LLM_SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://embeddings_service:8000")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def cache_key(model: str, prompt: str, variables: dict | None, max_tokens: int | None = None) -> str:
+    payload = json.dumps(
+        [model or "", normalize_prompt(prompt), variables or {}, max_tokens],
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def semantic_scope(model: str, variables: dict | None, max_tokens: int | None = None) -> str:
+    """Semantic matches never cross models, variable sets or output limits (only the prompt is embedded)."""
+    payload = json.dumps([model or "", variables or {}, max_tokens], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---------- backends ----------
+class MemoryBackend:
+    """In-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: dict, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisBackend:
+    """Shared across workers/hosts; Redis handles TTL, maxmemory-policy handles LRU."""
+
+    def __init__(self, url: str, prefix: str = "llm_cache:"):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> dict | None:
+        try:
+            raw = await self._redis.get(self.prefix + key)
+        except Exception as e:
+            print("[response_cache] Redis get failed:", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict, ttl: float):
+        try:
+            await self._redis.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            print("[response_cache] Redis set failed:", e)
+
+
+# ---------- semantic index ----------
+class SemanticIndex:
+    """Per-scope (model + variables, see semantic_scope) bounded list of (prompt embedding, exact cache key)."""
+
+    def __init__(self, max_entries: int, threshold: float):
+        import numpy as np
+        self.np = np
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._by_scope: dict[str, tuple[list, list]] = {}
+        self._lock = threading.Lock()
+        self._client = httpx.AsyncClient(timeout=5.0)
+
+    async def embed(self, prompt: str):
+        r = await self._client.post(
+            EMBEDDING_SERVICE_URL.rstrip("/") + "/api/embeddings",
+            json={"texts": [normalize_prompt(prompt)]},
+        )
+        r.raise_for_status()
+        v = self.np.asarray(r.json()["embeddings"][0], dtype=self.np.float32)
+        norm = self.np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def nearest(self, scope: str, vector) -> str | None:
+        with self._lock:
+            vectors, keys = self._by_scope.get(scope, ([], []))
+            if not vectors:
+                return None
+            scores = self.np.stack(vectors) @ vector
+        best = int(self.np.argmax(scores))
+        return keys[best] if scores[best] >= self.threshold else None
+
+    def add(self, scope: str, vector, key: str):
+        with self._lock:
+            vectors, keys = self._by_scope.setdefault(scope, ([], []))
+            vectors.append(vector)
+            keys.append(key)
+            if len(keys) > self.max_entries:
+                del vectors[0]
+                del keys[0]
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float, semantic: SemanticIndex | None = None):
+        self.backend = backend
+        self.ttl = ttl
+        self.semantic = semantic
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # prompt embeddings computed on a miss, reused by the following put()
+        self._pending_vectors: OrderedDict = OrderedDict()
+
+    async def get(self, model: str, prompt: str, variables: dict | None,
+                  max_tokens: int | None = None) -> dict | None:
+        key = cache_key(model, prompt, variables, max_tokens)
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.semantic is not None:
+            try:
+                vector = await self.semantic.embed(prompt)
+            except Exception as e:
+                print("[response_cache] Prompt embedding failed:", e)
+                vector = None
+            if vector is not None:
+                self._pending_vectors[key] = vector
+                while len(self._pending_vectors) > 1024:
+                    self._pending_vectors.popitem(last=False)
+                near = self.semantic.nearest(semantic_scope(model, variables, max_tokens), vector)
+                value = await self.backend.get(near) if near else None
+                if value is not None:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, model: str, prompt: str, variables: dict | None, value: dict,
+                  max_tokens: int | None = None):
+        key = cache_key(model, prompt, variables, max_tokens)
+        await self.backend.set(key, value, self.ttl)
+        if self.semantic is not None:
+            vector = self._pending_vectors.pop(key, None)
+            if vector is None:
+                try:
+                    vector = await self.semantic.embed(prompt)
+                except Exception as e:
+                    print("[response_cache] Prompt embedding failed:", e)
+                    return
+            self.semantic.add(semantic_scope(model, variables, max_tokens), vector, key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "backend": type(self.backend).__name__,
+        }
+
+
+def build_response_cache() -> ResponseCache | None:
+    if not CACHE_ENABLED:
+        return None
+    backend = RedisBackend(CACHE_REDIS_URL) if CACHE_REDIS_URL else MemoryBackend(CACHE_MAX_ENTRIES)
+    semantic = None
+    if SEMANTIC_CACHE:
+        try:
+            semantic = SemanticIndex(SEMANTIC_MAX_ENTRIES, SEMANTIC_THRESHOLD)
+        except ImportError as e:
+            print("[response_cache] Semantic cache disabled (numpy missing):", e)
+    return ResponseCache(backend, CACHE_TTL_SECONDS, semantic)
+
+
+response_cache = build_response_cache()
@@ -1,8 +1,23 @@
 # services/llm_services/app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+import asyncio
 from app.api.routes import router as api_router
+from app.core.analytics import ensure_analytics_schema
+from app.core.metrics_logger import metrics_writer
 
-app = FastAPI(title="Cortex LLM Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # no fallback: the metrics writer updates the rollup tables with every batch
+    await asyncio.to_thread(ensure_analytics_schema)
+    # background batch writer for LLM metrics; flushes what's left on shutdown
+    await metrics_writer.start()
+    yield
+    await metrics_writer.stop()
+
+
+app = FastAPI(title="Cortex LLM Service", lifespan=lifespan)
 
 # Health check
 @app.get("/health")
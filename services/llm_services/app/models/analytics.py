@@ -0,0 +1,47 @@
+# services/llm_services/app/models/analytics.py
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, UniqueConstraint
+from app.db.session import Base
+
+# Upper bounds (ms) of the latency histogram kept per rollup bucket; the last is open-ended.
+LATENCY_BOUNDS_MS = [
+    25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000,
+    3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000, float("inf"),
+]
+GRANULARITIES = ("minute", "hour")
+
+
+class LLMMetricRollup(Base):
+    """Counters per (granularity, bucket_start, model), incremented as metrics are written."""
+    __tablename__ = "llm_metric_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "model_name", name="uq_llm_metric_rollups_key"),
+        Index("ix_llm_metric_rollups_lookup", "granularity", "model_name", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    model_name = Column(String(128), nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    errors = Column(Integer, default=0, nullable=False)
+    cached_requests = Column(Integer, default=0, nullable=False)
+    input_tokens = Column(Integer, default=0, nullable=False)
+    output_tokens = Column(Integer, default=0, nullable=False)
+    total_tokens = Column(Integer, default=0, nullable=False)
+    cost_usd = Column(Float, default=0.0, nullable=False)
+    latency_sum_ms = Column(Float, default=0.0, nullable=False)
+
+
+class LLMMetricLatencyBin(Base):
+    """Latency histogram bins per rollup bucket; bin i counts latencies <= LATENCY_BOUNDS_MS[i]."""
+    __tablename__ = "llm_metric_latency_bins"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "model_name", "bin", name="uq_llm_metric_latency_bins_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    model_name = Column(String(128), nullable=False)
+    bin = Column(Integer, nullable=False)
+    count = Column(Integer, default=0, nullable=False)
@@ -1,11 +1,15 @@
 # services/llm_services/app/models/metrics.py
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text, Boolean, Index
 from app.db.session import Base
 
 
 class LLMRequestMetric(Base):
     __tablename__ = "llm_request_metrics"
+    __table_args__ = (
+        # per-model time-range scans (analytics, router health windows)
+        Index("ix_llm_request_metrics_model_created", "model_name", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     model_name = Column(String(128), nullable=False)